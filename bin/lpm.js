@@ -2,7 +2,10 @@
 'use strict';
 
 const { spawnSync } = require('child_process');
+const crypto = require('crypto');
 const fs = require('fs');
+const net = require('net');
+const os = require('os');
 const path = require('path');
 
 const PACKAGE_ROOT = path.resolve(__dirname, '..');
@@ -10,20 +13,134 @@ const VENV_PYTHON = process.platform === 'win32'
   ? path.join(PACKAGE_ROOT, '.venv', 'Scripts', 'python.exe')
   : path.join(PACKAGE_ROOT, '.venv', 'bin', 'python');
 const LPM_SCRIPT = path.join(PACKAGE_ROOT, 'src', 'LPM.py');
+// Written by `lpm server start` while a resident server is running. Must match
+// getServerStatePath() in src/lpm_server.py: a per-user directory, and a name
+// derived from this install's src directory.
+function defaultServerStatePath() {
+  const base = process.platform === 'win32'
+    ? process.env.LOCALAPPDATA || path.join(os.homedir(), 'AppData', 'Local')
+    : process.env.XDG_CACHE_HOME || path.join(os.homedir(), '.cache');
+  let installPath;
+  try {
+    installPath = fs.realpathSync.native(path.join(PACKAGE_ROOT, 'src'));
+  } catch {
+    installPath = path.join(PACKAGE_ROOT, 'src');
+  }
+  if (process.platform === 'win32') installPath = installPath.toLowerCase();
+  const installId = crypto.createHash('sha1').update(installPath, 'utf8').digest('hex').slice(0, 12);
+  return path.join(base, 'lpm', `server-${installId}.json`);
+}
+const SERVER_STATE = process.env.LPM_SERVER_STATE || defaultServerStatePath();
+// Commands that always run one-shot: server management itself, and commands with
+// full-screen interactive prompts that need the real terminal (unless --silent).
+const ONE_SHOT_COMMANDS = new Set(['server']);
+const INTERACTIVE_COMMANDS = new Set(['configure', 'init']);
+
+function runOneShot(argv) {
+  if (!fs.existsSync(VENV_PYTHON)) {
+    console.error(
+      `\nLPM error: bundled Python venv not found at ${VENV_PYTHON}.\n` +
+      'The npm postinstall step did not complete successfully. ' +
+      'Re-run `npm install -g @loupeteam/lpm` (or `npm install` in your project) ' +
+      'and check the output for the underlying error (commonly: Python 3.8+ is not on PATH).\n'
+    );
+    process.exit(1);
+  }
+
+  const result = spawnSync(VENV_PYTHON, [LPM_SCRIPT, ...argv], {
+    stdio: 'inherit',
+    shell: false,
+  });
 
-if (!fs.existsSync(VENV_PYTHON)) {
-  console.error(
-    `\nLPM error: bundled Python venv not found at ${VENV_PYTHON}.\n` +
-    'The npm postinstall step did not complete successfully. ' +
-    'Re-run `npm install -g @loupeteam/lpm` (or `npm install` in your project) ' +
-    'and check the output for the underlying error (commonly: Python 3.8+ is not on PATH).\n'
-  );
-  process.exit(1);
+  process.exit(result.status ?? 1);
 }
 
-const result = spawnSync(VENV_PYTHON, [LPM_SCRIPT, ...process.argv.slice(2)], {
-  stdio: 'inherit',
-  shell: false,
-});
+function readServerState(argv) {
+  if (process.env.LPM_NO_SERVER) return null;
+  const command = argv.find((arg) => !arg.startsWith('-'));
+  if (ONE_SHOT_COMMANDS.has(command)) return null;
+  const silent = argv.includes('-s') || argv.includes('--silent');
+  if (INTERACTIVE_COMMANDS.has(command) && !silent) return null;
+  try {
+    return JSON.parse(fs.readFileSync(SERVER_STATE, 'utf8'));
+  } catch {
+    return null;
+  }
+}
+
+// Forward the command to the resident server. Calls fallback() if the server
+// doesn't answer, in which case the command has not run.
+function runOnServer(state, argv, fallback) {
+  const address = state.family === 'unix'
+    ? { path: state.address }
+    : { host: '127.0.0.1', port: Number(state.address.split(':').pop()) };
+  const socket = net.createConnection(address);
+  let answered = false;
+  let finished = false;
+  let buffered = '';
+
+  const send = (message) => socket.write(JSON.stringify(message) + '\n');
 
-process.exit(result.status ?? 1);
+  socket.on('connect', () => {
+    send({
+      token: state.token,
+      argv,
+      cwd: process.cwd(),
+      env: process.env,
+      isatty: Boolean(process.stdout.isTTY),
+    });
+    process.stdin.on('data', (chunk) => send({ stdin: chunk.toString('utf8') }));
+    process.stdin.on('end', () => send({ stdin: null }));
+    // The first Ctrl+C interrupts the command on the server, like it would a
+    // one-shot run. A second one gives up on it; the server notices the hang-up.
+    let interrupted = false;
+    process.on('SIGINT', () => {
+      if (interrupted) {
+        socket.destroy();
+        process.exit(130);
+      }
+      interrupted = true;
+      send({ signal: 'SIGINT' });
+    });
+  });
+
+  socket.on('data', (chunk) => {
+    buffered += chunk.toString('utf8');
+    let newline;
+    while ((newline = buffered.indexOf('\n')) >= 0) {
+      const message = JSON.parse(buffered.slice(0, newline));
+      buffered = buffered.slice(newline + 1);
+      answered = true;
+      if (message.stdout !== undefined) process.stdout.write(message.stdout);
+      if (message.stderr !== undefined) process.stderr.write(message.stderr);
+      if (message.exit !== undefined) {
+        finished = true;
+        socket.end();
+        process.stdout.write('', () => process.exit(message.exit));
+      }
+    }
+  });
+
+  socket.on('close', () => {
+    if (!answered) {
+      // A stale state file can point at a dead server or at some other program
+      // that now owns the port. Nothing has run yet, so run the command ourselves.
+      process.stdin.pause();
+      fallback();
+    } else if (!finished) {
+      console.error('\nLPM error: lost connection to the LPM server.');
+      process.exit(1);
+    }
+  });
+
+  // Errors are always followed by 'close', which decides what to do.
+  socket.on('error', () => {});
+}
+
+const argv = process.argv.slice(2);
+const state = readServerState(argv);
+if (state) {
+  runOnServer(state, argv, () => runOneShot(argv));
+} else {
+  runOneShot(argv);
+}
@@ -13,16 +13,16 @@ functionality lives in lpm_core.py.
 """
 
 import argparse
-import ctypes
+import contextvars
+import io
 import json
-import logging
 import os.path
+import shlex
 import sys
 import time
 
-import aspython as ASTools
-
 # Core LPM functionality. The CLI delegates to functions defined in lpm_core.
+# lpm_core also provides ASTools, which only imports aspython on first use.
 from lpm_core import *
 
 
@@ -46,7 +46,9 @@ __author__ = 'Andrew Musser'
 # subcommand for argparse to recognise them.  Centralised here so that
 # _hoist_global_flags(), the fallback parser, and any future code all stay
 # in sync automatically.
-_GLOBAL_FLAG_SPELLINGS = {'-s', '--silent', '-nc', '--nocolor'}
+_GLOBAL_FLAG_SPELLINGS = {'-s', '--silent', '-nc', '--nocolor', '--profile'}
+# Global flags that take a value (``--flag VALUE`` or ``--flag=VALUE``).
+_GLOBAL_VALUE_FLAG_SPELLINGS = {'--profile-trace', '--metrics-out'}
 
 
 # ---------------------------------------------------------------------------
@@ -73,7 +75,20 @@ cprint = _plain_print
 # ---------------------------------------------------------------------------
 
 # Commands that never require authentication.
-_NO_AUTH = {'login', 'logout', 'delete', 'status'}
+_NO_AUTH = {
+    'login',
+    'logout',
+    'delete',
+    'status',
+    'bundle',
+    'store',
+    'server',
+    'sync',
+    'deploy',
+    'watch',
+    'why',
+    'batch',
+}
 
 # Commands that may run before `lpm init` has been invoked (i.e. don't require
 # a package.json in the current directory).
@@ -89,8 +104,18 @@ _NO_INIT_REQUIRED = {
     'docs',
     'as',
     'init',
+    'bundle',
+    'store',
+    'workspace',
+    'server',
+    'batch',
 }
 
+# Commands that only query the registry and print, so consecutive ones in a batch may run at the same
+# time. They must not touch TempObjects or the per-command caches (see _run_command()), which the
+# threads of a batch group share.
+_BATCH_CONCURRENT = {'view', 'info', 'viewall'}
+
 
 def _normalize_packages(raw_packages):
     """Prepend the @loupeteam scope and split @version suffixes."""
@@ -221,19 +246,20 @@ def cmd_as(args):
     cprint('Good to go!', 'green')
 
 
+# Sync packages, reporting what the sync of each project template did.
+def _sync_packages(packages):
+    for package, (copied, skipped, removed) in syncPackages(packages).items():
+        if skipped or removed:
+            summary = f'{package}: copied {len(copied)} template file(s), skipped {len(skipped)} unchanged'
+            if removed:
+                summary += f', removed {len(removed)} no longer in the template'
+            print(summary + '.')
+
+
 def cmd_init(args):
-    as_project = False
-    as_library = False
-    try:
-        ASTools.Project('.')
-        as_project = True
-    except:
-        as_project = False
-    try:
-        ASTools.Library('.')
-        as_library = True
-    except:
-        as_library = False
+    directoryType = classifyPackagePath('.')
+    as_project = directoryType == 'project'
+    as_library = directoryType == 'library'
 
     if as_project or args.asproject:
         print('Automation Studio project found, initializing package manager...')
@@ -286,7 +312,7 @@ def cmd_init(args):
             # Install the latest version; npm's default caret range in
             # package.json pins us to compatible (non-major) upgrades.
             installPackages(starterProject, ['latest'])
-            syncPackages(starterProject)
+            _sync_packages(starterProject)
             configureProject(args)
             print(colored('Your local directory is now ready to be used with LPM.', 'green'))
 
@@ -303,7 +329,27 @@ def cmd_debug(args):
 def cmd_install(args):
     packages, packageVersions = _normalize_packages(args.packages)
 
-    if not args.source:
+    if args.direct and not packages:
+        cprint('--direct needs the packages to install.', 'yellow')
+        return
+    if args.direct and not args.source:
+        print('Installing ' + ', '.join(packages) + ' directly into the project...')
+        try:
+            remaining = installPackagesDirect(packages, packageVersions)
+        except Exception as e:
+            cprint(f'Error while attempting to install package(s): {e}', 'yellow')
+            return
+        # Packages other than libraries still go through npm and sync.
+        if remaining:
+            npmPackages = [package for package, _ in remaining]
+            try:
+                installPackages(npmPackages, [version for _, version in remaining])
+            except:
+                cprint('Error while attempting to install package(s).', 'yellow')
+                return
+            _sync_packages(getAllDependencies(npmPackages))
+        sourceDependencies = []
+    elif not args.source:
         if packages:
             print('Installing ' + ', '.join(packages) + '...')
         else:
@@ -319,14 +365,12 @@ def cmd_install(args):
             deps = getPackageManifestField('package.json', ['dependencies']) or {}
             packages = list(deps.keys())
         # Move packages from the node_modules folder into the project/main directory.
-        syncPackages(getAllDependencies(packages))
+        _sync_packages(getAllDependencies(packages))
         sourceDependencies = []
     else:
         if packages:
             print('Attempting to install source for ' + ', '.join(args.packages) + '...')
-        sourceDependencies = []
-        for package, packageVersion in zip(packages, packageVersions):
-            installSource(package, packageVersion, sourceDependencies)
+        sourceDependencies = installSourcePackages(packages, packageVersions)
 
     # Deploy relevant objects to cpu.sw.
     deploymentConfigs = getPackageManifestField('package.json', ['lpmConfig', 'deploymentConfigs'])
@@ -361,16 +405,176 @@ def cmd_uninstall(args):
     if not packages:
         print(colored('Please provide the name of at least one package.', 'yellow'))
         return
+    # Work out which libraries become orphaned, and where they live in the project, while their
+    # manifests are still in node_modules.
+    removals = None
+    if os.path.exists('package-lock.json'):
+        orphans = getOrphanedPackages(packages, getDependentsIndex())
+        configs = getPackageManifestField('package.json', ['lpmConfig', 'deploymentConfigs']) or []
+        removals = getProjectRemovals(orphans, configs)
     print('Uninstalling ' + ', '.join(packages) + '...')
     try:
         uninstallPackages(packages)
     except:
         cprint('Error while attempting to uninstall package(s).', 'yellow')
         return
-    syncPackages(getAllDependencies(packages))
+    if removals is not None and removals['packages']:
+        print('Removing ' + ', '.join(removals['packages']) + ' from the project...')
+        removePackagesFromProject(removals)
     cprint('Operation completed successfully.', 'green')
 
 
+def cmd_why(args):
+    packages, _ = _normalize_packages(args.packages)
+    if not packages:
+        print(colored('Please provide the name of at least one package.', 'yellow'))
+        return
+    if not os.path.exists('package-lock.json'):
+        cprint('No package-lock.json found. Run lpm install first.', 'yellow')
+        return
+    dependents = getDependentsIndex()
+    for package in packages:
+        chains = getDependencyChains(package, dependents)
+        if chains is None:
+            cprint(f'{package} is not installed.', 'yellow')
+            continue
+        if not chains:
+            print(f'{package} is installed, but nothing depends on it.')
+            continue
+        print(f'{package} is required by:')
+        for chain in chains:
+            if len(chain) == 2:
+                print('  the project (direct dependency)')
+            else:
+                print('  ' + ' <- '.join(chain[1:-1]) + ' <- the project')
+
+
+# Why planSync() selected a package, for `lpm sync` output.
+_SYNC_REASONS = {
+    'new': 'not synced yet',
+    'changed': 'changed in node_modules',
+    'missing': 'missing from the project',
+    'forced': 'forced',
+}
+
+
+def cmd_sync(args):
+    dependencies = getPackageManifestField('package.json', ['dependencies']) or {}
+    packages = getAllDependencies(list(dependencies.keys()))
+    plan = planSync(packages, force=args.force)
+    if not plan:
+        cprint(f'All {len(packages)} package(s) are up to date.', 'green')
+        return
+    for package, reason in plan:
+        action = 'Would sync ' if args.dry_run else 'Syncing '
+        print(action + package + ' ' + colored(f'({_SYNC_REASONS[reason]})', 'yellow'))
+    if args.dry_run:
+        print(f'{len(plan)} of {len(packages)} package(s) would be synced.')
+        return
+    _sync_packages([package for package, _ in plan])
+    cprint(f'Synced {len(plan)} of {len(packages)} package(s).', 'green')
+
+
+# How `lpm deploy` describes one deployment entry from getDeploymentEntries().
+def _describe_deployment(entry):
+    if entry[0] == 'library':
+        return 'library ' + entry[2]
+    if entry[0] == 'task':
+        return f'task {entry[2]} -> {entry[3]}'
+    return 'pre-build step ' + entry[1]
+
+
+def cmd_deploy(args):
+    configs = args.config or getPackageManifestField('package.json', ['lpmConfig', 'deploymentConfigs'])
+    if not configs:
+        cprint("No deployment configurations. Pass --config, or set them up with 'lpm configure'.", 'yellow')
+        return
+    missing = [config for config in configs if not os.path.isdir(os.path.join('Physical', config))]
+    if missing:
+        cprint('Unknown configuration(s): ' + ', '.join(missing), 'yellow')
+        return False
+    dependencies = getPackageManifestField('package.json', ['dependencies']) or {}
+    packages = getAllDependencies(list(dependencies.keys()))
+    packages += [package for package in getSourceInfoStore().packages() if package not in packages]
+    for config in configs:
+        if args.dry_run:
+            entries = getDeploymentEntries(config, packages)
+            if not args.force:
+                deployed = getDeployedEntries(config)
+                entries = [entry for entry in entries if not isEntryDeployed(entry, deployed)]
+        else:
+            entries = deployPackages(config, packages, onlyChanged=not args.force)
+        if not entries:
+            cprint(f'{config}: up to date.', 'green')
+            continue
+        action = 'Would deploy ' if args.dry_run else 'Deployed '
+        for entry in entries:
+            print(f'{config}: {action}{_describe_deployment(entry)}')
+    if not args.dry_run:
+        cprint('Operation completed successfully.', 'green')
+
+
+def cmd_watch(args):
+    targets = getWatchTargets()
+    if not targets:
+        cprint('No installed or source packages to watch.', 'yellow')
+        return
+
+    def on_change(package, applied):
+        stamp = time.strftime('%H:%M:%S')
+        if not applied:
+            print(f'[{stamp}] {package}: no project changes needed')
+        for change in applied:
+            print(f'[{stamp}] {package}: {change}')
+
+    def on_error(package, error):
+        cprint(f'[{time.strftime("%H:%M:%S")}] {package}: {error}', 'red')
+
+    print(f'Watching {len(targets)} package(s) for changes. Press Ctrl+C to stop.')
+    try:
+        watchPackages(on_change, on_error, interval=args.interval, debounce=args.debounce)
+    except KeyboardInterrupt:
+        print('Stopped watching.')
+
+
+def cmd_update(args):
+    if not args.source:
+        # Without --source, `lpm update` is still npm's update.
+        cmd_npm_passthrough(args)
+        return
+    packages, versions = _normalize_packages(args.packages)
+    refs = dict(zip(packages, versions)) if packages else None
+    unknown = [package for package in packages if package not in getSourceInfoStore()]
+    if unknown:
+        cprint('Not installed as source: ' + ', '.join(unknown), 'yellow')
+        return
+    if not getSourceInfoStore().packages():
+        cprint('No packages are installed as source.', 'yellow')
+        return
+    print('Fetching source repositories...')
+    results = updateSourceRepos(refs, jobs=args.jobs)
+    for result in results:
+        if result['error'] is not None:
+            status = colored(result['error'], 'red')
+        elif result['changed']:
+            status = colored(f'{(result["before"] or "")[:8]} -> {(result["after"] or "")[:8]}', 'green')
+        else:
+            status = 'up to date'
+        print(f'{os.path.basename(result["repoPath"]):<30} {result["seconds"]:6.2f}s  {status}')
+    changed = [package for result in results if result['changed'] for package in result['packages']]
+    for package in changed:
+        print(f'Re-syncing {package}...')
+        refreshSourcePackage(package)
+    failed = sum(1 for result in results if result['error'] is not None)
+    updated = sum(1 for result in results if result['changed'] and result['error'] is None)
+    cprint(
+        f'{len(results)} repo(s): {updated} updated, {len(results) - updated - failed} up to date, {failed} failed.',
+        'yellow' if failed else 'green',
+    )
+    if failed:
+        return False
+
+
 def cmd_git(args):
     packages, _ = _normalize_packages(args.packages)
     gitClient = getPackageManifestField('package.json', ['lpmConfig', 'gitClient'])
@@ -380,11 +584,9 @@ def cmd_git(args):
     if gitClient != 'GitExtensions':
         cprint(f"We don't support {gitClient}, are you kidding?", 'yellow')
         return
-    sourceInfoFilePath = os.path.join('.', 'TempObjects', 'sourceInfo.json')
-    sourceInfo = getJsonData(sourceInfoFilePath)
     print(f'Opening {gitClient} for these packages: ' + ', '.join(args.packages))
     for package in packages:
-        repoPath = sourceInfo.get(package, {}).get('repoPath', None)
+        repoPath = getSourceInfoStore().get(package, {}).get('repoPath', None)
         if repoPath is not None:
             cmd = ['gitex.cmd', 'openrepo', '"' + os.path.join(os.getcwd(), repoPath) + '"']
             executeAndContinue(cmd)
@@ -441,6 +643,316 @@ def cmd_list(args):
     executeStandard(['npm list', '-all'])
 
 
+def _default_bundle_name():
+    data = getPackageManifestData('package.json')
+    name = data.get('name') or 'project'
+    version = data.get('version') or '0.0.0'
+    return f'{name.lstrip("@").replace("/", "-")}-{version}.lpmbundle.tar'
+
+
+def cmd_bundle(args):
+    if args.action == 'create':
+        if not os.path.exists('package.json'):
+            cprint('Local directory not initialized. Please run lpm init before creating a bundle.', 'yellow')
+            return
+        bundlePath = args.file or _default_bundle_name()
+        print('Creating bundle ' + colored(bundlePath, 'yellow') + '...')
+        try:
+            bundleManifest = createBundle(bundlePath)
+        except Exception as e:
+            cprint(f'Error while creating bundle: {e}', 'yellow')
+            return
+        cprint(f'Bundled {len(bundleManifest["packages"])} package(s) into {bundlePath}.', 'green')
+    else:
+        if not args.file:
+            cprint('Please provide the path of the bundle to restore.', 'yellow')
+            return
+        print('Restoring project from bundle ' + colored(args.file, 'yellow') + '...')
+        try:
+            bundleManifest = restoreBundle(args.file)
+        except Exception as e:
+            cprint(f'Error while restoring bundle: {e}', 'yellow')
+            return
+        cprint(f'Restored {len(bundleManifest["packages"])} package(s) from {args.file}.', 'green')
+
+
+def cmd_store(args):
+    storePath = getPackageStorePath()
+    if storePath is None:
+        cprint('The package store is disabled. Set lpmConfig.packageStore or LPM_STORE_DIR to enable it.', 'yellow')
+        return
+    if args.action == 'path':
+        print(storePath)
+    elif args.action == 'status':
+        status = getPackageStoreStatus(storePath)
+        print('-> Location: ' + colored(storePath, 'green'))
+        print('-> Package versions: ' + colored(str(status['packages']), 'green'))
+        print('-> Unique files: ' + colored(str(status['files']), 'green'))
+        print('-> Size on disk: ' + colored(f'{status["bytes"] / (1024 * 1024):.1f} MB', 'green'))
+    else:
+        print('Pruning package versions that are no longer linked into any project...')
+        removed = prunePackageStore(storePath)
+        cprint(f'Removed {removed} unused package version(s) from the store.', 'green')
+
+
+def cmd_workspace(args):
+    try:
+        projectDirs, jobs = loadWorkspaceConfig(args.config)
+    except FileNotFoundError:
+        cprint(f'No workspace configuration found at {args.config}.', 'yellow')
+        return
+    except ValueError as e:
+        cprint(f'Error: {e}', 'yellow')
+        return
+    if args.jobs:
+        jobs = args.jobs
+    start = time.perf_counter()
+    if args.action == 'install':
+        specs = collectWorkspaceDependencies(projectDirs)
+        print(f'Resolving {len(specs)} shared dependencies for {len(projectDirs)} projects...')
+        try:
+            prefetchWorkspaceDependencies(specs)
+        except:
+            cprint('Error while resolving the shared workspace dependencies.', 'yellow')
+            return
+    print(f'Running {args.action} for {len(projectDirs)} projects on {jobs} worker(s)...')
+    results = runWorkspace(projectDirs, args.action, jobs)
+    totalSeconds = round(time.perf_counter() - start, 3)
+
+    root = os.path.dirname(os.path.abspath(args.config))
+    names = [os.path.relpath(result['project'], root) for result in results]
+    name_col_width = max(len('PROJECT'), *(len(name) for name in names)) + 2
+    print('PROJECT'.ljust(name_col_width) + 'STATUS'.ljust(10) + 'PACKAGES'.ljust(10) + 'TIME')
+    print('-------'.ljust(name_col_width) + '------'.ljust(10) + '--------'.ljust(10) + '----')
+    for name, result in zip(names, results):
+        if result['ok']:
+            status = colored('ok'.ljust(10), 'green')
+        else:
+            status = colored('failed'.ljust(10), 'red')
+        print(name.ljust(name_col_width) + status + str(result['packages']).ljust(10) + f'{result["seconds"]:.1f}s')
+    failures = [(name, result) for name, result in zip(names, results) if not result['ok']]
+    for name, result in failures:
+        cprint(f'\n{name} failed: {result["error"]}', 'yellow')
+        print(result['output'].rstrip())
+    if args.report:
+        saveJsonData({'action': args.action, 'seconds': totalSeconds, 'projects': results}, args.report)
+        print(f'Workspace report written to {args.report}')
+    if failures:
+        cprint(f'{len(failures)} of {len(results)} projects failed ({totalSeconds:.1f}s total).', 'yellow')
+    else:
+        cprint(f'All {len(results)} projects completed successfully ({totalSeconds:.1f}s total).', 'green')
+
+
+class _ThreadRoutedStream:
+    """Stand-in for sys.stdout/sys.stderr while batch commands run concurrently.
+
+    Writes from a thread that has a buffer attached go to that buffer, so that
+    each command's output can be replayed in batch order; anything else goes
+    to the real stream. The buffer is held in a context variable, so the
+    threads that lpm_core starts to read a child process's output (which run
+    in a copy of the caller's context) write to the same buffer.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = contextvars.ContextVar('buffer', default=None)
+
+    def capture(self, buffer):
+        self._buffer.set(buffer)
+
+    def write(self, text):
+        return (self._buffer.get() or self._stream).write(text)
+
+    def flush(self):
+        (self._buffer.get() or self._stream).flush()
+
+    def __getattr__(self, attr):
+        return getattr(self._stream, attr)
+
+
+def _read_batch(source):
+    """Return (line number, argv) for each command in a batch file ('-' reads stdin).
+
+    Lines are split like a shell would, without backslash escapes so that
+    Windows paths work. Blank lines and # comments are skipped, and a leading
+    `lpm` is optional.
+    """
+    if source == '-':
+        text = sys.stdin.read()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            text = f.read()
+    commands = []
+    for number, line in enumerate(text.splitlines(), 1):
+        lexer = shlex.shlex(line, posix=True)
+        lexer.whitespace_split = True
+        lexer.escape = ''
+        argv = list(lexer)
+        if argv and argv[0].lower() in ('lpm', 'lpm.py'):
+            argv = argv[1:]
+        if argv:
+            commands.append((number, argv))
+    return commands
+
+
+def _run_batch_command(ns, fresh=True):
+    """Run one batch command; return True unless it raised or exited with an error."""
+    cprint('> lpm ' + ns.batch_line, 'green')
+    try:
+        _run_command(ns, fresh)
+    except SystemExit as e:
+        return e.code in (None, 0)
+    except KeyboardInterrupt:
+        raise
+    except Exception as e:
+        cprint(f'Error: {e}', 'yellow')
+        return False
+    return True
+
+
+def _run_batch_group(group, jobs):
+    """Run read-only batch commands concurrently, replaying their output in order.
+
+    While the group runs, sys.stdout and sys.stderr are swapped for streams
+    that route each thread's output to its own buffer.
+    """
+    if len(group) == 1 or jobs <= 1:
+        return [_run_batch_command(ns) for ns in group]
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Authenticate once up front rather than in every thread.
+    if any(ns.cmd not in _NO_AUTH for ns in group):
+        isAuthenticated()
+    realStdout, realStderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _ThreadRoutedStream(realStdout), _ThreadRoutedStream(realStderr)
+
+    def run(ns, buffer):
+        sys.stdout.capture(buffer)
+        sys.stderr.capture(buffer)
+        try:
+            return _run_batch_command(ns, fresh=False)
+        finally:
+            sys.stdout.capture(None)
+            sys.stderr.capture(None)
+
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=min(jobs, len(group))) as executor:
+            buffers = [io.StringIO() for _ in group]
+            futures = [executor.submit(run, ns, buffer) for ns, buffer in zip(group, buffers)]
+            for future, buffer in zip(futures, buffers):
+                results.append(future.result())
+                realStdout.write(buffer.getvalue())
+                realStdout.flush()
+    finally:
+        sys.stdout, sys.stderr = realStdout, realStderr
+    return results
+
+
+def cmd_batch(args):
+    try:
+        commands = _read_batch(args.file)
+    except (OSError, ValueError) as e:
+        cprint(f'Error reading batch {args.file}: {e}', 'yellow')
+        sys.exit(1)
+
+    # Parse everything first, so that a typo on a late line fails before anything has run.
+    parser, sub = _build_parser('LPM')
+    parsed = []
+    for number, argv in commands:
+        try:
+            ns = _parse_command_line(parser, sub, argv)
+        except SystemExit:
+            cprint(f'Line {number}: invalid command: {shlex.join(argv)}', 'yellow')
+            sys.exit(2)
+        if not getattr(ns, 'cmd', None) or ns.cmd in ('batch', 'server'):
+            cprint(f'Line {number}: {shlex.join(argv)} cannot run in a batch.', 'yellow')
+            sys.exit(2)
+        # Global flags are set up once for the whole process, so they belong on `lpm batch`.
+        if ns.profile or ns.profile_trace or ns.metrics_out or ns.silent or ns.nocolor:
+            cprint(f'Line {number}: pass --silent/--nocolor/--profile/--metrics-out to `lpm batch` itself.', 'yellow')
+            sys.exit(2)
+        ns.silent = args.silent
+        ns.batch_line = shlex.join(argv)
+        parsed.append(ns)
+
+    # Consecutive read-only commands form one group; anything else runs on its own, in order.
+    groups = []
+    for ns in parsed:
+        if groups and ns.cmd in _BATCH_CONCURRENT and groups[-1][0].cmd in _BATCH_CONCURRENT:
+            groups[-1].append(ns)
+        else:
+            groups.append([ns])
+
+    start = time.perf_counter()
+    completed = failed = 0
+    for group in groups:
+        results = _run_batch_group(group, args.jobs)
+        completed += results.count(True)
+        failed += results.count(False)
+        if failed and not args.keep_going:
+            break
+    seconds = time.perf_counter() - start
+    skipped = len(parsed) - completed - failed
+    if failed:
+        cprint(f'{failed} of {len(parsed)} batch commands failed, {skipped} skipped ({seconds:.1f}s).', 'yellow')
+        sys.exit(1)
+    cprint(f'All {len(parsed)} batch commands completed ({seconds:.1f}s).', 'green')
+
+
+def _run_resident(argv):
+    """Run one command inside the resident server process."""
+    sys.argv = ['lpm', *argv]
+    main()
+
+
+def cmd_server(args):
+    import lpm_server
+
+    if args.action == 'run':
+        lpm_server.serve(_run_resident, args.idle_timeout)
+    elif args.action == 'start':
+        reply = lpm_server.requestServer('ping')
+        if reply is not None:
+            print('The LPM server is already running (pid ' + colored(str(reply['pid']), 'green') + ').')
+            return
+        import subprocess
+
+        command = [sys.executable, os.path.abspath(__file__), 'server', 'run', '--idle-timeout', str(args.idle_timeout)]
+        if sys.platform == 'win32':
+            detach = {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            detach = {'start_new_session': True}
+        subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            **detach,
+        )
+        reply = lpm_server.waitForServer()
+        if reply is None:
+            cprint('Error: the LPM server did not start.', 'yellow')
+            return
+        cprint(
+            f'LPM server started (pid {reply["pid"]}). It stops after {args.idle_timeout} idle seconds.',
+            'green',
+        )
+    elif args.action == 'stop':
+        if lpm_server.requestServer('stop') is None:
+            print('The LPM server is not running.')
+        else:
+            cprint('LPM server stopped.', 'green')
+    else:
+        reply = lpm_server.requestServer('ping')
+        if reply is None:
+            print('-> Server: ' + colored('Not running', 'yellow'))
+        else:
+            print('-> Server: ' + colored(f'Running (pid {reply["pid"]})', 'green'))
+            print('-> Idle timeout: ' + colored(f'{reply["idleTimeout"]} seconds', 'green'))
+
+
 def cmd_npm_passthrough(args):
     """Fallback for any command not recognized as an LPM subcommand."""
     packages, _ = _normalize_packages(args.packages)
@@ -468,6 +980,19 @@ def _build_parser(prog_name):
     parser.add_argument(
         '-nc', '--nocolor', action='store_true', help="Don't color the output - to avoid dependency on termcolor"
     )
+    parser.add_argument(
+        '--profile', action='store_true', help='Print a per-phase timing summary when the command finishes'
+    )
+    parser.add_argument(
+        '--profile-trace',
+        metavar='FILE',
+        help='Write a Chrome trace (chrome://tracing, Perfetto) of the command to FILE',
+    )
+    parser.add_argument(
+        '--metrics-out',
+        metavar='FILE',
+        help='Write operation counters (child processes, manifest reads, copies, HTTP calls) to FILE as JSON',
+    )
     parser.add_argument('-v', '--version', action='version', version='%(prog)s: ' + __version__)
 
     sub = parser.add_subparsers(dest='cmd', metavar='command')
@@ -535,6 +1060,11 @@ def _build_parser(prog_name):
     p = sub.add_parser('install', help='Install one or more packages')
     p.add_argument('packages', nargs='*')
     p.add_argument('-src', '--source', action='store_true', help='Use source code for libraries instead of binaries')
+    p.add_argument(
+        '--direct',
+        action='store_true',
+        help='Stream libraries from the registry straight into Logical instead of going through node_modules',
+    )
     p.set_defaults(func=cmd_install)
 
     # uninstall
@@ -542,6 +1072,41 @@ def _build_parser(prog_name):
     p.add_argument('packages', nargs='*')
     p.set_defaults(func=cmd_uninstall)
 
+    # why
+    p = sub.add_parser('why', help='Show which packages require an installed package')
+    p.add_argument('packages', nargs='*')
+    p.set_defaults(func=cmd_why)
+
+    # sync
+    p = sub.add_parser('sync', help='Sync packages from node_modules into the project without running npm')
+    p.add_argument('--dry-run', action='store_true', help='Only list the packages that would be synced')
+    p.add_argument('-f', '--force', action='store_true', help='Sync every package, even if it looks up to date')
+    p.set_defaults(func=cmd_sync)
+
+    # deploy
+    p = sub.add_parser('deploy', help='Deploy installed packages to cpu.sw without running npm or sync')
+    p.add_argument(
+        '-c', '--config', action='append', help='Configuration to deploy to (repeatable; default: lpmConfig)'
+    )
+    p.add_argument('--dry-run', action='store_true', help='Only list the entries that would be deployed')
+    p.add_argument('-f', '--force', action='store_true', help='Redeploy every entry, even if cpu.sw already has it')
+    p.set_defaults(func=cmd_deploy)
+
+    # watch
+    p = sub.add_parser('watch', help='Keep the project in sync with edits to installed and source packages')
+    p.add_argument('--interval', type=float, default=0.2, help='Seconds between polls (default: 0.2)')
+    p.add_argument(
+        '--debounce', type=float, default=0.3, help='Seconds changes must settle before applying (default: 0.3)'
+    )
+    p.set_defaults(func=cmd_watch)
+
+    # update
+    p = sub.add_parser('update', help='Update packages (with --source: fetch and fast-forward source repos)')
+    p.add_argument('packages', nargs='*')
+    p.add_argument('-src', '--source', action='store_true', help='Update the repos of packages installed as source')
+    p.add_argument('-j', '--jobs', type=int, default=4, help='Number of repos to fetch in parallel (default: 4)')
+    p.set_defaults(func=cmd_update)
+
     # git
     p = sub.add_parser('git', help='Open the configured Git client for source-installed packages')
     p.add_argument('packages', nargs='*')
@@ -556,29 +1121,76 @@ def _build_parser(prog_name):
     p.add_argument('packages', nargs='*')
     p.set_defaults(func=cmd_list)
 
+    # bundle
+    p = sub.add_parser('bundle', help='Create or restore an offline bundle of the resolved dependencies')
+    p.add_argument('action', choices=['create', 'restore'])
+    p.add_argument('file', nargs='?', help='Bundle archive path (defaults to <name>-<version>.lpmbundle.tar on create)')
+    p.set_defaults(func=cmd_bundle)
+
+    # store
+    p = sub.add_parser('store', help='Inspect or prune the global package store')
+    p.add_argument('action', choices=['status', 'path', 'prune'])
+    p.set_defaults(func=cmd_store)
+
+    # workspace
+    p = sub.add_parser('workspace', help='Install or sync every AS project listed in a workspace configuration')
+    p.add_argument('action', choices=['install', 'sync'])
+    p.add_argument('-c', '--config', default=WORKSPACE_CONFIG_NAME, help='Workspace configuration file')
+    p.add_argument('-j', '--jobs', type=int, help='Number of projects to process in parallel')
+    p.add_argument('--report', help='Write the aggregated per-project report to this JSON file')
+    p.set_defaults(func=cmd_workspace)
+
+    # batch
+    p = sub.add_parser('batch', help='Run the LPM commands listed in a file (or stdin) in one process')
+    p.add_argument('file', help="File with one LPM command per line, or '-' to read stdin")
+    p.add_argument('-j', '--jobs', type=int, default=4, help='Read-only commands to run at once (default: 4)')
+    p.add_argument('-k', '--keep-going', action='store_true', help='Keep running after a command fails')
+    p.set_defaults(func=cmd_batch)
+
+    # server
+    p = sub.add_parser('server', help='Manage the resident LPM server that keeps LPM warm between calls')
+    p.add_argument('action', choices=['start', 'stop', 'status', 'run'])
+    p.add_argument(
+        '--idle-timeout',
+        type=int,
+        default=600,
+        help='Seconds without requests after which the server exits (default: 600)',
+    )
+    p.set_defaults(func=cmd_server)
+
     return parser, sub
 
 
 def _hoist_global_flags(argv):
-    """Move -s/--silent and -nc/--nocolor before the subcommand if they appear after it.
+    """Move global flags before the subcommand if they appear after it.
 
     This allows both ``lpm --silent install`` and ``lpm install --silent``.
+    Value flags (``--profile-trace FILE``) move together with their value.
     """
     global_flags = _GLOBAL_FLAG_SPELLINGS
     prefix = []  # tokens up to and including the subcommand
     suffix = []  # tokens after the subcommand
     cmd_found = False
-    for token in argv:
+    i = 0
+    while i < len(argv):
+        token = argv[i]
+        i += 1
         if not cmd_found:
             prefix.append(token)
-            if not token.startswith('-'):
+            if token in _GLOBAL_VALUE_FLAG_SPELLINGS and i < len(argv):
+                prefix.append(argv[i])
+                i += 1
+            elif not token.startswith('-'):
                 cmd_found = True
+        elif token in global_flags or token.split('=', 1)[0] in _GLOBAL_VALUE_FLAG_SPELLINGS:
+            # Insert before the subcommand (last item in prefix).
+            hoisted = [token]
+            if token in _GLOBAL_VALUE_FLAG_SPELLINGS and i < len(argv):
+                hoisted.append(argv[i])
+                i += 1
+            prefix[len(prefix) - 1 : len(prefix) - 1] = hoisted
         else:
-            if token in global_flags:
-                # Insert before the subcommand (last item in prefix).
-                prefix.insert(len(prefix) - 1, token)
-            else:
-                suffix.append(token)
+            suffix.append(token)
     return prefix + suffix
 
 
@@ -590,10 +1202,8 @@ def _is_known_command(parser, sub, argv):
     behavior where unknown commands are passed through to npm.
     """
     known = set(sub.choices.keys())
-    # Flags that take a value at the top level. Currently none do (--silent
-    # and --nocolor are store_true), but keep the structure in case that
-    # changes.
-    value_flags = set()
+    # Flags that take a value at the top level.
+    value_flags = _GLOBAL_VALUE_FLAG_SPELLINGS
     i = 0
     while i < len(argv):
         token = argv[i]
@@ -609,6 +1219,27 @@ def _is_known_command(parser, sub, argv):
     return False  # no command at all → let argparse error
 
 
+def _parse_command_line(parser, sub, argv):
+    """Parse an LPM command line (without the program name) into a namespace."""
+    raw_args = _hoist_global_flags(argv)
+
+    # Legacy behavior: any unrecognized first command is forwarded to npm.
+    if raw_args and not _is_known_command(parser, sub, raw_args):
+        fallback = argparse.ArgumentParser(add_help=False)
+        # Keep these in sync with _GLOBAL_FLAG_SPELLINGS.
+        fallback.add_argument('-s', '--silent', action='store_true')
+        fallback.add_argument('-nc', '--nocolor', action='store_true')
+        fallback.add_argument('--profile', action='store_true')
+        fallback.add_argument('--profile-trace')
+        fallback.add_argument('--metrics-out')
+        ns, leftover = fallback.parse_known_args(raw_args)
+        ns.cmd = leftover[0] if leftover else ''
+        ns.packages = leftover[1:]
+        ns.func = cmd_npm_passthrough  # type: ignore[attr-defined]
+        return ns
+    return parser.parse_args(raw_args)
+
+
 # ---------------------------------------------------------------------------
 # Entry point.
 # ---------------------------------------------------------------------------
@@ -622,20 +1253,7 @@ def main():
 
     parser, sub = _build_parser(prog_name)
 
-    raw_args = _hoist_global_flags(sys.argv[1:])
-
-    # Legacy behavior: any unrecognized first command is forwarded to npm.
-    if raw_args and not _is_known_command(parser, sub, raw_args):
-        fallback = argparse.ArgumentParser(add_help=False)
-        # Keep these in sync with _GLOBAL_FLAG_SPELLINGS.
-        fallback.add_argument('-s', '--silent', action='store_true')
-        fallback.add_argument('-nc', '--nocolor', action='store_true')
-        ns, leftover = fallback.parse_known_args(raw_args)
-        ns.cmd = leftover[0] if leftover else ''
-        ns.packages = leftover[1:]
-        ns.func = cmd_npm_passthrough  # type: ignore[attr-defined]
-    else:
-        ns = parser.parse_args(raw_args)
+    ns = _parse_command_line(parser, sub, sys.argv[1:])
 
     # Configure output coloring now that --nocolor is known.
     if not ns.nocolor:
@@ -653,6 +1271,33 @@ def main():
         parser.print_help()
         return
 
+    profiling = ns.profile or ns.profile_trace
+    if not (profiling or ns.metrics_out):
+        _run_command(ns)
+        return
+
+    if profiling:
+        startProfiling()
+    if ns.metrics_out:
+        startMetrics()
+    try:
+        with profileSpan('lpm ' + ns.cmd, 'command'):
+            _run_command(ns)
+    finally:
+        stopProfiling()
+        stopMetrics()
+        if ns.metrics_out:
+            writeMetrics(ns.metrics_out, command=ns.cmd, version=__version__)
+        if ns.profile:
+            print()
+            for line in formatProfileSummary():
+                print(line)
+        if ns.profile_trace:
+            writeChromeTrace(ns.profile_trace)
+            print('Profile trace written to ' + colored(ns.profile_trace, 'green'))
+
+
+def _run_command(ns, fresh=True):
     # Auth gate.
     if ns.cmd not in _NO_AUTH and not isAuthenticated():
         cprint('No credentials found. Please call lpm login before attempting other operations.', 'yellow')
@@ -663,13 +1308,33 @@ def main():
         cprint('Local directory not initialized. Please run lpm init before attempting other operations.', 'yellow')
         return
 
-    ns.func(ns)
+    # A resident server runs many commands in one process; start each from a fresh view of the project.
+    # Read-only commands that a batch runs side by side share the view instead.
+    if not fresh:
+        result = ns.func(ns)
+    else:
+        resetLogicalPackageTree()
+        getSourceInfoStore().reset()
+        try:
+            result = ns.func(ns)
+        finally:
+            # Source installs made by the command are saved once, at the end.
+            getSourceInfoStore().commit()
+    # A command that failed has said why; it returns False to set the exit status.
+    if result is False:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
+    import logging
+
     # Configure colored logger
     logging.basicConfig(stream=sys.stderr, level=logging.INFO)
-    kernel32 = ctypes.windll.kernel32
-    kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
+    if sys.platform == 'win32':
+        import ctypes
+
+        # Enable ANSI escape sequences so colored output renders in the Windows console.
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetConsoleMode(kernel32.GetStdHandle(-11), 7)
 
     main()
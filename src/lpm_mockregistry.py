@@ -0,0 +1,261 @@
+"""
+ * File: lpm_mockregistry.py
+ * Copyright (c) 2023 Loupe
+ * https://loupe.team
+ *
+ * This file is part of LPM, licensed under the MIT License.
+
+Local stand-in for the GitHub Packages REST API.
+
+Implements the three endpoints LPM uses (organization package list, package
+detail and package versions) for a synthetic set of packages, with
+configurable latency, page size, rate limiting and error injection. Point LPM
+at it with LPM_GITHUB_API_URL (or a local lpmConfig.githubApiUrl) to
+load-test `lpm viewall` and friends without touching GitHub.
+
+Usage:
+    python src/lpm_mockregistry.py --packages 1500 --latency 0.05 --rate-limit 500
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockRegistry:
+    """A GitHub Packages API stand-in running on a background thread.
+
+    packages: number of synthetic npm packages (named pkg0000, pkg0001, ...).
+    versions: number of versions per package.
+    latency, jitter: seconds added to every response, plus up to `jitter` more.
+    maxPageSize: cap applied to `per_page`, like GitHub's limit of 100.
+    rateLimit, rateLimitWindow: requests allowed per window of seconds. Every response carries
+        X-RateLimit-* headers; once the budget is used up, requests get 429 with Retry-After.
+    errorRate: fraction of requests answered with a random 500/502/503 instead.
+    seed: seed for error injection and jitter, so that runs are repeatable.
+    """
+
+    def __init__(
+        self,
+        packages=100,
+        versions=3,
+        latency=0.0,
+        jitter=0.0,
+        maxPageSize=100,
+        rateLimit=None,
+        rateLimitWindow=60.0,
+        errorRate=0.0,
+        seed=0,
+        organization='loupeteam',
+    ):
+        self.versions = versions
+        self.latency = latency
+        self.jitter = jitter
+        self.maxPageSize = maxPageSize
+        self.rateLimit = rateLimit
+        self.rateLimitWindow = rateLimitWindow
+        self.errorRate = errorRate
+        self.organization = organization
+        self.packages = [self._package(i) for i in range(packages)]
+        self._byName = {package['name']: package for package in self.packages}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._windowStart = time.monotonic()
+        self._windowUsed = 0
+        self._server = None
+        # Request counts by outcome ('ok', 'rate_limited', 'error', 'unauthorized', 'not_found').
+        self.stats = {}
+
+    def _package(self, index):
+        return {
+            'id': index + 1,
+            'name': f'pkg{index:04d}',
+            'package_type': 'npm',
+            'version_count': self.versions,
+            'visibility': 'private',
+            'created_at': '2023-01-01T00:00:00Z',
+            'updated_at': '2023-01-01T00:00:00Z',
+            'repository': {'description': f'Synthetic package {index}'},
+        }
+
+    def _versions(self, package):
+        return [
+            {
+                'id': package['id'] * 1000 + v,
+                'name': f'1.0.{v}',
+                'created_at': f'2024-01-{v + 1:02d}T00:00:00Z',
+                'updated_at': f'2024-01-{v + 1:02d}T00:00:00Z',
+            }
+            for v in reversed(range(self.versions))
+        ]
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] = self.stats.get(outcome, 0) + 1
+
+    # Returns (allowed, headers) for one request under the rate limit.
+    def _takeRateLimit(self):
+        if self.rateLimit is None:
+            return True, {}
+        with self._lock:
+            now = time.monotonic()
+            if now - self._windowStart >= self.rateLimitWindow:
+                self._windowStart = now
+                self._windowUsed = 0
+            allowed = self._windowUsed < self.rateLimit
+            if allowed:
+                self._windowUsed += 1
+            resetIn = max(self.rateLimitWindow - (now - self._windowStart), 0.0)
+            headers = {
+                'X-RateLimit-Limit': str(self.rateLimit),
+                'X-RateLimit-Remaining': str(self.rateLimit - self._windowUsed),
+                'X-RateLimit-Used': str(self._windowUsed),
+                'X-RateLimit-Reset': str(int(time.time() + resetIn) + 1),
+            }
+            if not allowed:
+                headers['Retry-After'] = str(max(int(resetIn + 0.999), 1))
+        return allowed, headers
+
+    def _delay(self):
+        with self._lock:
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    def _injectError(self):
+        if not self.errorRate:
+            return None
+        with self._lock:
+            if self._random.random() >= self.errorRate:
+                return None
+            return self._random.choice([500, 502, 503])
+
+    # Route one GET request. Returns (status, headers, body).
+    def handle(self, path, headers):
+        self._delay()
+        if not headers.get('Authorization', '').startswith('Bearer '):
+            self._count('unauthorized')
+            return 401, {}, {'message': 'Requires authentication'}
+        allowed, rateHeaders = self._takeRateLimit()
+        if not allowed:
+            self._count('rate_limited')
+            return 429, rateHeaders, {'message': 'API rate limit exceeded'}
+        errorStatus = self._injectError()
+        if errorStatus is not None:
+            self._count('error')
+            return errorStatus, rateHeaders, {'message': 'Injected server error'}
+
+        url = urlparse(path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+        if len(parts) < 3 or parts[:1] != ['orgs'] or parts[1] != self.organization or parts[2] != 'packages':
+            self._count('not_found')
+            return 404, rateHeaders, {'message': 'Not Found'}
+        if len(parts) == 3:
+            return self._page(self.packages, query, url.path, rateHeaders)
+        package = self._byName.get(parts[4]) if len(parts) >= 5 and parts[3] == 'npm' else None
+        if package is None or len(parts) > 6 or (len(parts) == 6 and parts[5] != 'versions'):
+            self._count('not_found')
+            return 404, rateHeaders, {'message': 'Not Found'}
+        if len(parts) == 6:
+            return self._page(self._versions(package), query, url.path, rateHeaders)
+        self._count('ok')
+        return 200, rateHeaders, package
+
+    def _page(self, items, query, path, headers):
+        perPage = min(int(query.get('per_page', ['30'])[0]), self.maxPageSize)
+        page = int(query.get('page', ['1'])[0])
+        if (page * perPage) < len(items):
+            headers = dict(headers, Link=f'<{self.url}{path}?page={page + 1}&per_page={perPage}>; rel="next"')
+        self._count('ok')
+        return 200, headers, items[(page - 1) * perPage : page * perPage]
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self, host='127.0.0.1', port=0):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                status, headers, body = registry.handle(self.path, self.headers)
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the GitHub Packages API')
+    parser.add_argument('--port', type=int, default=0, help='Port to listen on (default: any free port)')
+    parser.add_argument('--packages', type=int, default=1000, help='Number of synthetic packages')
+    parser.add_argument('--versions', type=int, default=3, help='Versions per package')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many extra seconds per response')
+    parser.add_argument('--page-size', type=int, default=100, help='Maximum per_page honored')
+    parser.add_argument('--rate-limit', type=int, help='Requests allowed per rate-limit window')
+    parser.add_argument('--rate-limit-window', type=float, default=60.0, help='Rate-limit window in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail with 5xx')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for jitter and error injection')
+    args = parser.parse_args(argv)
+
+    registry = MockRegistry(
+        packages=args.packages,
+        versions=args.versions,
+        latency=args.latency,
+        jitter=args.jitter,
+        maxPageSize=args.page_size,
+        rateLimit=args.rate_limit,
+        rateLimitWindow=args.rate_limit_window,
+        errorRate=args.error_rate,
+        seed=args.seed,
+    )
+    url = registry.start(port=args.port)
+    print(f'Mock GitHub Packages API listening on {url}')
+    print(f'Point LPM at it with: LPM_GITHUB_API_URL={url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        registry.stop()
+        print(f'Requests served: {json.dumps(registry.stats)}')
+
+
+if __name__ == '__main__':
+    main()
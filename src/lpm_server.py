@@ -0,0 +1,355 @@
+"""
+ * File: lpm_server.py
+ * Copyright (c) 2023 Loupe
+ * https://loupe.team
+ *
+ * This file is part of LPM, licensed under the MIT License.
+
+Resident LPM server.
+
+Build scripts often call lpm dozens of times in a row, and each call pays for
+interpreter startup, imports and the npm auth check. The resident server keeps
+one warm LPM process alive behind a local socket: bin/lpm.js forwards argv,
+cwd, environment and stdin to it and relays the output back. When no server is
+running, the shim falls back to the regular one-shot path.
+
+Protocol: one connection per command, newline-delimited JSON messages.
+Client -> server: {"token", "argv", "cwd", "env", "isatty"}, then any number
+of {"stdin": text} messages and {"stdin": null} at end of input, and
+{"signal": "SIGINT"} when the user presses Ctrl+C. Control requests use
+{"token", "control": "ping" | "stop"} instead of argv.
+Server -> client: {"stdout": text} / {"stderr": text} while the command runs,
+then {"exit": code}. A client that disconnects before the exit message
+interrupts its command, like Ctrl+C.
+"""
+
+import _thread
+import contextlib
+import hashlib
+import json
+import os
+import secrets
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+# Default number of idle seconds after which the server shuts itself down.
+DEFAULT_IDLE_TIMEOUT = 600
+
+_HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+# Per-user directory for the state file: %LOCALAPPDATA%\lpm on Windows, and
+# $XDG_CACHE_HOME/lpm (~/.cache/lpm) elsewhere. The install directory itself may be
+# read-only, and a global install is shared by every user of the machine.
+def _getUserStateDirectory():
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'lpm')
+
+
+# Location of the state file that advertises a running server. Its name is derived
+# from this install's src directory, so that bin/lpm.js (which computes the same
+# name) only ever talks to a server from its own install. LPM_SERVER_STATE
+# overrides it (bin/lpm.js honors the same variable).
+def getServerStatePath():
+    if os.environ.get('LPM_SERVER_STATE'):
+        return os.environ['LPM_SERVER_STATE']
+    installPath = _HERE.lower() if sys.platform == 'win32' else _HERE
+    installId = hashlib.sha1(installPath.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(_getUserStateDirectory(), f'server-{installId}.json')
+
+
+def getServerState():
+    try:
+        with open(getServerStatePath(), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _writeServerState(state):
+    statePath = getServerStatePath()
+    os.makedirs(os.path.dirname(statePath) or '.', mode=0o700, exist_ok=True)
+    temporaryPath = f'{statePath}.{os.getpid()}.tmp'
+    with open(temporaryPath, 'w') as f:
+        json.dump(state, f)
+    os.replace(temporaryPath, statePath)
+
+
+def _removeServerState(token):
+    # Only remove the state file if it still describes this server.
+    state = getServerState()
+    if state is not None and state.get('token') == token:
+        try:
+            os.remove(getServerStatePath())
+        except OSError:
+            pass
+
+
+def _createListener():
+    # Prefer a Unix domain socket. Where those aren't available (Windows), listen on the loopback
+    # interface instead; every request must then carry the token from the user's state file.
+    if hasattr(socket, 'AF_UNIX') and sys.platform != 'win32':
+        address = os.path.join(tempfile.gettempdir(), f'lpm-{os.getuid()}-{secrets.token_hex(4)}.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+        os.chmod(address, 0o600)
+        return listener, 'unix', address
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('127.0.0.1', 0))
+    return listener, 'tcp', f'127.0.0.1:{listener.getsockname()[1]}'
+
+
+def _connect(state, timeout=2):
+    if state['family'] == 'unix':
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(state['address'])
+    else:
+        host, _, port = state['address'].rpartition(':')
+        connection = socket.create_connection((host, int(port)), timeout=timeout)
+    return connection
+
+
+class _Channel:
+    """Newline-delimited JSON messages over a connected socket."""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._reader = connection.makefile('r', encoding='utf-8', newline='\n')
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        with self._lock:
+            try:
+                self._connection.sendall(data)
+            except OSError:
+                # The client went away; _pumpInput() interrupts the command.
+                pass
+
+    def receive(self):
+        line = self._reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        # Shutting the socket down wakes up a thread still waiting in receive(). The socket only
+        # really closes once its reader file is closed too.
+        with contextlib.suppress(OSError):
+            self._connection.shutdown(socket.SHUT_RDWR)
+        self._reader.close()
+        self._connection.close()
+
+
+# Send a control request ('ping' or 'stop') to the running server. Returns its reply, or None if no
+# server answered.
+def requestServer(control):
+    state = getServerState()
+    if state is None:
+        return None
+    try:
+        connection = _connect(state)
+    except OSError:
+        return None
+    channel = _Channel(connection)
+    try:
+        channel.send({'token': state['token'], 'control': control})
+        return channel.receive()
+    except (OSError, ValueError):
+        return None
+    finally:
+        channel.close()
+
+
+def _pumpOutput(readFd, channel, stream):
+    with os.fdopen(readFd, 'rb', buffering=0) as pipe:
+        while True:
+            data = pipe.read(65536)
+            if not data:
+                return
+            channel.send({stream: data.decode('utf-8', errors='replace')})
+
+
+# Raise KeyboardInterrupt in the command, which runs on the main thread. A real SIGINT also cuts
+# short a blocking call such as time.sleep(); Windows only has the simulated one.
+def _interruptMainThread():
+    if hasattr(signal, 'pthread_kill'):
+        signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+    else:
+        _thread.interrupt_main()
+
+
+class _CommandState:
+    """The command of one request, which the client can interrupt for as long as it runs.
+
+    The interrupt is a SIGINT for the main thread, handled by onSignal() while
+    the request is being served. It may arrive just after the command ended,
+    and is then ignored rather than breaking into the server.
+    """
+
+    def __init__(self):
+        self.running = True
+
+    def interrupt(self):
+        if self.running:
+            _interruptMainThread()
+
+    def onSignal(self, signum, frame):
+        if self.running:
+            raise KeyboardInterrupt
+
+
+# Relay the client's messages until it disconnects: stdin text into the command's stdin, and Ctrl+C
+# as KeyboardInterrupt. A client that goes away (e.g. Ctrl+C in bin/lpm.js) interrupts the command
+# too, so that an abandoned command doesn't hold up the clients behind it.
+def _pumpInput(channel, writeFd, command):
+    with os.fdopen(writeFd, 'wb', buffering=0) as pipe:
+        while True:
+            try:
+                message = channel.receive()
+            except (OSError, ValueError):
+                message = None
+            if message is None:
+                command.interrupt()
+                return
+            if message.get('signal') == 'SIGINT':
+                command.interrupt()
+            elif 'stdin' in message and not pipe.closed:
+                try:
+                    if message['stdin'] is None:
+                        pipe.close()
+                    else:
+                        pipe.write(message['stdin'].encode('utf-8'))
+                except OSError:
+                    pipe.close()
+
+
+def _runRequest(request, channel, runCommand):
+    # Swap the process-level stdio (file descriptors, not just sys.stdout) for pipes, so that output
+    # from npm and git child processes is relayed to the client as well.
+    savedFds = {fd: os.dup(fd) for fd in (0, 1, 2)}
+    savedEnv = dict(os.environ)
+    savedCwd = os.getcwd()
+    savedStdin = sys.stdin
+    pumps = []
+    exitCode = 0
+    command = _CommandState()
+    savedHandler = signal.getsignal(signal.SIGINT)
+    try:
+        stdinRead, stdinWrite = os.pipe()
+        os.dup2(stdinRead, 0)
+        os.close(stdinRead)
+        pumps.append(threading.Thread(target=_pumpInput, args=(channel, stdinWrite, command), daemon=True))
+        for fd, stream in ((1, 'stdout'), (2, 'stderr')):
+            readFd, writeFd = os.pipe()
+            os.dup2(writeFd, fd)
+            os.close(writeFd)
+            pumps.append(threading.Thread(target=_pumpOutput, args=(readFd, channel, stream), daemon=True))
+        for pump in pumps:
+            pump.start()
+        sys.stdin = open(0, 'r', encoding='utf-8', closefd=False)
+
+        os.environ.clear()
+        os.environ.update(request.get('env') or savedEnv)
+        if request.get('isatty'):
+            # The output is a pipe from our side, but the user is looking at a terminal.
+            os.environ.setdefault('FORCE_COLOR', '1')
+        os.chdir(request['cwd'])
+        signal.signal(signal.SIGINT, command.onSignal)
+        try:
+            runCommand(request['argv'])
+        except SystemExit as e:
+            exitCode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except KeyboardInterrupt:
+            exitCode = 130
+        except Exception:
+            traceback.print_exc()
+            exitCode = 1
+    finally:
+        command.running = False
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.stdin = savedStdin
+        for fd, saved in savedFds.items():
+            os.dup2(saved, fd)
+            os.close(saved)
+        os.chdir(savedCwd)
+        os.environ.clear()
+        os.environ.update(savedEnv)
+        # Output pumps finish once every writer (including any child processes) has closed the
+        # pipe. Don't wait forever on detached children such as `lpm as`.
+        for pump in pumps[1:]:
+            pump.join(timeout=2)
+    channel.send({'exit': exitCode})
+    # Hang up so that the input pump stops, and only then restore the SIGINT handler: an interrupt
+    # it sent while the command was ending still has to land in onSignal().
+    channel.close()
+    if pumps:
+        pumps[0].join(timeout=2)
+    signal.signal(signal.SIGINT, savedHandler)
+
+
+# Serve LPM commands until no request has arrived for idleTimeout seconds (or a stop request).
+# runCommand(argv) runs one LPM command in this process.
+def serve(runCommand, idleTimeout=DEFAULT_IDLE_TIMEOUT):
+    # Relay output to the client as it is produced rather than when the command ends.
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stderr.reconfigure(line_buffering=True)
+    listener, family, address = _createListener()
+    token = secrets.token_hex(16)
+    listener.listen(8)
+    listener.settimeout(idleTimeout)
+    _writeServerState({'pid': os.getpid(), 'family': family, 'address': address, 'token': token})
+    try:
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except socket.timeout:
+                return
+            connection.settimeout(None)
+            channel = _Channel(connection)
+            try:
+                request = channel.receive()
+            except (OSError, ValueError):
+                request = None
+            try:
+                if request is None or not secrets.compare_digest(str(request.get('token', '')), token):
+                    continue
+                control = request.get('control')
+                if control == 'stop':
+                    channel.send({'stopping': True})
+                    return
+                if control == 'ping':
+                    channel.send({'pid': os.getpid(), 'idleTimeout': idleTimeout})
+                    continue
+                _runRequest(request, channel, runCommand)
+            finally:
+                channel.close()
+    finally:
+        listener.close()
+        _removeServerState(token)
+        if family == 'unix':
+            try:
+                os.remove(address)
+            except OSError:
+                pass
+
+
+# Wait until a freshly started server answers pings. Returns its ping reply, or None on timeout.
+def waitForServer(timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        reply = requestServer('ping')
+        if reply is not None:
+            return reply
+        time.sleep(0.1)
+    return None
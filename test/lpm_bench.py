@@ -0,0 +1,369 @@
+"""
+ * File: lpm_bench.py
+ * Copyright (c) 2023 Loupe
+ * https://loupe.team
+ *
+ * This file is part of LPM, licensed under the MIT License.
+
+Benchmark harness for the LPM hot paths.
+
+Generates synthetic Automation Studio projects (N libraries, M programs, K
+configurations, nested @loupeteam dependencies already "installed" in
+node_modules), puts fake `npm` and `git` executables first on PATH, serves the
+GitHub packages API stand-in from lpm_mockregistry.py, and times
+getAllDependencies, syncPackages, deployPackages and printLoupePackageList at
+several sizes.
+
+Usage:
+    python test/lpm_bench.py [--sizes small,medium,large] [--runs 5]
+                             [--output results.json] [--compare baseline.json]
+
+Nothing here talks to the real registry or GitHub. Syncing and deploying
+still go through aspython, so it must be installed.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+_SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+if _SRC not in sys.path:
+    sys.path.insert(0, _SRC)
+
+import lpm_core  # noqa: E402
+from lpm_mockregistry import MockRegistry  # noqa: E402
+
+# name: (libraries, programs, configs)
+SIZES = {
+    'small': (20, 2, 1),
+    'medium': (100, 10, 4),
+    'large': (200, 20, 10),
+}
+
+# Each library depends on up to this many libraries with a higher index, so the dependency graph
+# is nested several levels deep and full of diamonds, like the real @loupeteam libraries.
+DEPENDENCY_FANOUT = 3
+
+_XML_HEADER = '<?xml version="1.0" encoding="utf-8"?>\n<?AutomationStudio FileVersion="4.9"?>\n'
+
+_APJ = """<?xml version="1.0" encoding="utf-8"?>
+<?AutomationStudio Version=4.12.4.107 FileVersion="4.9"?>
+<Project Version="1.00.0" Edition="Standard" EditionComment="Standard" xmlns="http://br-automation.co.at/AS/Project">
+  <Communication />
+  <ANSIC DefaultIncludes="true" />
+  <IEC ExtendedConstants="true" IecExtendedComments="true" KeywordsAsStructureMembers="false" NamingConventions="true" Pointers="true" Preprocessor="false" />
+  <Motion RestartAcoposParameter="true" RestartInitParameter="true" />
+  <Project StoreRuntimeInProject="false" />
+  <Variables DefaultInitValue="0" DefaultRetain="false" DefaultVolatile="true" />
+</Project>
+"""
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def _packageXml(objects, root='Package', namespace='Package'):
+    lines = [f'    <Object Type="{objectType}">{name}</Object>' for objectType, name in objects]
+    return (
+        _XML_HEADER
+        + f'<{root} xmlns="http://br-automation.co.at/AS/{namespace}">\n  <Objects>\n'
+        + ''.join(line + '\n' for line in lines)
+        + f'  </Objects>\n</{root}>\n'
+    )
+
+
+def libraryName(index):
+    return f'benchlib{index:03d}'
+
+
+def programName(index):
+    return f'benchprog{index:03d}'
+
+
+def _libraryDependencies(index, libraries):
+    return [libraryName(i) for i in range(index + 1, min(index + 1 + DEPENDENCY_FANOUT, libraries))]
+
+
+def _writeLibraryPackage(root, index, libraries, configs):
+    name = libraryName(index)
+    packagePath = os.path.join(root, 'node_modules', '@loupeteam', name)
+    dependencies = _libraryDependencies(index, libraries)
+    manifest = {
+        'name': f'@loupeteam/{name}',
+        'version': '1.0.0',
+        'description': f'Synthetic benchmark library {index}',
+        'lpm': {
+            'type': 'library',
+            'physical': {
+                'cpu': [{'config': f'Config{k}', 'attributes': {'Description': name}} for k in range(configs)]
+            },
+        },
+        'dependencies': {f'@loupeteam/{dependency}': '^1.0.0' for dependency in dependencies},
+    }
+    _write(os.path.join(packagePath, 'package.json'), json.dumps(manifest, indent=2))
+    dependencyXml = ''.join(
+        f'    <Dependency ObjectName="{dependency}" FromVersion="1.0.0" ToVersion="1.99.99" />\n'
+        for dependency in dependencies
+    )
+    _write(
+        os.path.join(packagePath, 'ANSIC.lby'),
+        _XML_HEADER
+        + '<Library Version="1.0.0" SubType="ANSIC" xmlns="http://br-automation.co.at/AS/Library">\n'
+        + '  <Files>\n    <File>Types.typ</File>\n    <File>Lib.fun</File>\n    <File>Lib.c</File>\n  </Files>\n'
+        + f'  <Dependencies>\n{dependencyXml}  </Dependencies>\n</Library>\n',
+    )
+    _write(os.path.join(packagePath, 'Types.typ'), 'TYPE\nEND_TYPE\n')
+    _write(os.path.join(packagePath, 'Lib.fun'), f'FUNCTION {name}Version : UDINT\nEND_FUNCTION\n')
+    # Some bulk so that copies cost something, roughly the size of a small real library.
+    _write(os.path.join(packagePath, 'Lib.c'), '/* synthetic */\n' + 'int filler(void) { return 0; }\n' * 200)
+    _write(os.path.join(packagePath, 'README.md'), f'# {name}\n')
+
+
+def _writeProgramPackage(root, index):
+    name = programName(index)
+    packagePath = os.path.join(root, 'node_modules', '@loupeteam', name)
+    taskName = f'Prog{index:03d}'
+    manifest = {
+        'name': f'@loupeteam/{name}',
+        'version': '1.0.0',
+        'description': f'Synthetic benchmark program {index}',
+        'lpm': {
+            'type': 'program',
+            'logical': {'destination': os.path.join('Programs', name)},
+            'physical': {'cpu': [{'source': taskName, 'destination': 'Cyclic#4'}]},
+        },
+        'dependencies': {f'@loupeteam/{libraryName(0)}': '^1.0.0'},
+    }
+    _write(os.path.join(packagePath, 'package.json'), json.dumps(manifest, indent=2))
+    _write(
+        os.path.join(packagePath, taskName, 'IEC.prg'),
+        _XML_HEADER
+        + '<Program SubType="IEC" xmlns="http://br-automation.co.at/AS/Program">\n'
+        + '  <Files>\n    <File Description="Init, cyclic, exit code">Main.st</File>\n  </Files>\n</Program>\n',
+    )
+    _write(os.path.join(packagePath, taskName, 'Main.st'), 'PROGRAM _CYCLIC\nEND_PROGRAM\n')
+
+
+def _writeConfiguration(root, index):
+    config = f'Config{index}'
+    configPath = os.path.join(root, 'Physical', config)
+    _write(
+        os.path.join(configPath, 'Config.pkg'), _packageXml([('Cpu', 'X20CP0484')], 'Configuration', 'Configuration')
+    )
+    _write(
+        os.path.join(configPath, 'X20CP0484', 'cpu.pkg'),
+        _XML_HEADER
+        + '<Cpu xmlns="http://br-automation.co.at/AS/Cpu">\n  <Objects>\n'
+        + '    <Object Type="File" Description="Software configuration">cpu.sw</Object>\n  </Objects>\n'
+        + '  <Configuration ModuleId="X20CP0484">\n    <Build GccVersion="6.3.0" />\n  </Configuration>\n</Cpu>\n',
+    )
+    taskClasses = ''.join(f'  <TaskClass Name="Cyclic#{i}" />\n' for i in range(1, 9))
+    _write(
+        os.path.join(configPath, 'X20CP0484', 'cpu.sw'),
+        _XML_HEADER
+        + '<SwConfiguration CpuAddress="SL1" xmlns="http://br-automation.co.at/AS/SwConfiguration">\n'
+        + taskClasses
+        + '  <Libraries />\n</SwConfiguration>\n',
+    )
+    return config
+
+
+# Generate a synthetic AS project with its dependencies already installed in node_modules, as
+# `npm install` would leave it. Returns the list of top-level dependencies (package names).
+def generateProject(root, libraries, programs, configs):
+    _write(os.path.join(root, 'BenchProject.apj'), _APJ)
+    _write(os.path.join(root, 'Logical', 'Package.pkg'), _packageXml([('Package', 'Libraries')]))
+    _write(os.path.join(root, 'Logical', 'Libraries', 'Package.pkg'), _packageXml([]))
+    for index in range(libraries):
+        _writeLibraryPackage(root, index, libraries, configs)
+    for index in range(programs):
+        _writeProgramPackage(root, index)
+    deploymentConfigs = [_writeConfiguration(root, index) for index in range(configs)]
+    _write(
+        os.path.join(root, 'Physical', 'Physical.pkg'),
+        _packageXml([('Configuration', config) for config in deploymentConfigs], 'Physical', 'Physical'),
+    )
+    # Only every few libraries are direct dependencies; the rest come in transitively.
+    topLevel = [f'@loupeteam/{libraryName(i)}' for i in range(0, libraries, DEPENDENCY_FANOUT + 1)]
+    topLevel += [f'@loupeteam/{programName(i)}' for i in range(programs)]
+    manifest = {
+        'name': 'benchproject',
+        'version': '1.0.0',
+        'dependencies': {package: '^1.0.0' for package in topLevel},
+        'lpmConfig': {'deploymentConfigs': deploymentConfigs},
+    }
+    _write(os.path.join(root, 'package.json'), json.dumps(manifest, indent=2))
+    return topLevel
+
+
+_FAKE_TOOL = """import sys
+args = sys.argv[1:]
+if {name!r} == 'npm' and args[:1] == ['whoami']:
+    print('bench-user')
+sys.exit(0)
+"""
+
+
+# Create fake `npm` and `git` executables that succeed instantly (npm whoami prints a user), so
+# benchmarks measure LPM itself. Returns the directory to put first on PATH.
+def createFakeTools(directory):
+    os.makedirs(directory, exist_ok=True)
+    for name in ('npm', 'git'):
+        script = os.path.join(directory, f'{name}_stub.py')
+        _write(script, _FAKE_TOOL.format(name=name))
+        if sys.platform == 'win32':
+            _write(os.path.join(directory, f'{name}.cmd'), f'@"{sys.executable}" "{script}" %*\n')
+        else:
+            launcher = os.path.join(directory, name)
+            _write(launcher, f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+            os.chmod(launcher, 0o755)
+    return directory
+
+
+@contextlib.contextmanager
+def benchEnvironment(workDir, packageCount):
+    """Fake tools on PATH, a home directory with an npm token, and the GitHub stand-in."""
+    home = os.path.join(workDir, 'home')
+    _write(os.path.join(home, '.npmrc'), '//npm.pkg.github.com/:_authToken=bench-token\n')
+    toolDir = createFakeTools(os.path.join(workDir, 'bin'))
+    registry = MockRegistry(packages=packageCount)
+    apiUrl = registry.start()
+    savedEnv = dict(os.environ)
+    os.environ.update(
+        {
+            'PATH': toolDir + os.pathsep + os.environ.get('PATH', ''),
+            'HOME': home,
+            'USERPROFILE': home,
+            'LPM_GITHUB_API_URL': apiUrl,
+        }
+    )
+    try:
+        yield
+    finally:
+        registry.stop()
+        os.environ.clear()
+        os.environ.update(savedEnv)
+
+
+def _timeOperation(function, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# Time every operation on a freshly generated project of the given size. Operation counters from
+# the last run of each operation are included, since they don't vary between runs.
+def benchmarkSize(workDir, size, runs):
+    libraries, programs, configs = SIZES[size]
+    projectDir = os.path.join(workDir, size)
+    topLevel = generateProject(projectDir, libraries, programs, configs)
+    previousDir = os.getcwd()
+    os.chdir(projectDir)
+    try:
+        packages = lpm_core.getAllDependencies(topLevel)
+        configNames = [f'Config{k}' for k in range(configs)]
+        operations = {
+            'getAllDependencies': lambda: lpm_core.getAllDependencies(topLevel),
+            'syncPackages': lambda: lpm_core.syncPackages(packages),
+            'deployPackages': lambda: [lpm_core.deployPackages(config, packages) for config in configNames],
+            'printLoupePackageList': lpm_core.printLoupePackageList,
+        }
+        results = {'libraries': libraries, 'programs': programs, 'configs': configs, 'operations': {}}
+        for name, function in operations.items():
+            samples = _timeOperation(function, runs - 1) if runs > 1 else []
+            lpm_core.startMetrics()
+            samples += _timeOperation(function, 1)
+            lpm_core.stopMetrics()
+            results['operations'][name] = {
+                'median': round(statistics.median(samples), 6),
+                'min': round(min(samples), 6),
+                'runs': len(samples),
+                'counters': {
+                    metric: data['total'] for metric, data in lpm_core.getMetricsSnapshot()['counters'].items()
+                },
+            }
+        return results
+    finally:
+        os.chdir(previousDir)
+
+
+def runBenchmarks(sizes, runs):
+    workDir = tempfile.mkdtemp(prefix='lpm-bench-')
+    try:
+        results = {}
+        with benchEnvironment(workDir, max(SIZES[size][0] for size in sizes)):
+            for size in sizes:
+                results[size] = benchmarkSize(workDir, size, runs)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': runs,
+        'sizes': results,
+    }
+
+
+def formatResults(results, baseline=None):
+    lines = ['SIZE'.ljust(8) + 'OPERATION'.ljust(24) + 'MEDIAN'.rjust(11) + 'MIN'.rjust(11) + 'VS BASE'.rjust(10)]
+    for size, sizeResults in results['sizes'].items():
+        for operation, data in sizeResults['operations'].items():
+            ratio = ''
+            try:
+                baseMedian = baseline['sizes'][size]['operations'][operation]['median']
+                ratio = f'{data["median"] / baseMedian:9.2f}x'
+            except (KeyError, TypeError, ZeroDivisionError):
+                pass
+            lines.append(
+                size.ljust(8)
+                + operation.ljust(24)
+                + f'{data["median"]:10.3f}s'
+                + f'{data["min"]:10.3f}s'
+                + ratio.rjust(10)
+            )
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the LPM hot paths on synthetic projects')
+    parser.add_argument('--sizes', default='small,medium,large', help=f'Comma-separated subset of {", ".join(SIZES)}')
+    parser.add_argument('--runs', type=int, default=5, help='Timed runs per operation (default: 5)')
+    parser.add_argument('--output', help='Save the results as JSON to this file')
+    parser.add_argument('--compare', help='Show the change relative to results saved by an earlier run')
+    args = parser.parse_args(argv)
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f'unknown size(s): {", ".join(unknown)}')
+
+    results = runBenchmarks(sizes, max(args.runs, 1))
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    for line in formatResults(results, baseline):
+        print(line)
+    if args.output:
+        lpm_core.saveJsonData(results, args.output)
+        print(f'Results saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Tests for the GitHub Packages API stand-in (lpm_mockregistry.py) and for
+how lpm_core's HTTP paths behave against it: pagination, rate limiting and
+injected server errors.
+"""
+
+import pytest
+
+import lpm_core
+from lpm_mockregistry import MockRegistry
+
+
+@pytest.fixture
+def registryEnv(tmp_path, monkeypatch):
+    """Point lpm_core at a mock registry. Call the returned function with MockRegistry options."""
+    (tmp_path / '.npmrc').write_text('//npm.pkg.github.com/:_authToken=test-token\n')
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('USERPROFILE', str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    registries = []
+
+    def start(**options):
+        registry = MockRegistry(**options)
+        monkeypatch.setenv('LPM_GITHUB_API_URL', registry.start())
+        registries.append(registry)
+        return registry
+
+    yield start
+    for registry in registries:
+        registry.stop()
+
+
+class TestMockRegistry:
+    def test_lists_more_than_a_thousand_packages(self, registryEnv):
+        registry = registryEnv(packages=1234)
+        error, packages = lpm_core.getLoupePackageListData()
+        assert error is None
+        assert len(packages) == 1234
+        assert registry.stats == {'ok': 13}
+
+    def test_follows_link_header_when_page_size_is_capped(self, registryEnv):
+        registryEnv(packages=120, maxPageSize=50)
+        error, packages = lpm_core.getLoupePackageListData()
+        assert error is None
+        assert [p['name'] for p in packages] == [f'pkg{i:04d}' for i in range(120)]
+
+    def test_package_detail_and_versions(self, registryEnv):
+        registryEnv(packages=5, versions=4)
+        error, package = lpm_core.getLoupePackageData('@loupeteam/pkg0003')
+        assert error is None and package['version_count'] == 4
+        assert lpm_core.getLoupePackageLatestVersionDate('@loupeteam/pkg0003') == (None, '2024-01-04T00:00:00Z')
+        error, _ = lpm_core.getLoupePackageData('@loupeteam/missing')
+        assert error.startswith('Status code not OK. Code: 404')
+
+    def test_retries_after_rate_limit(self, registryEnv):
+        registry = registryEnv(packages=5, rateLimit=2, rateLimitWindow=1.0)
+        results = [lpm_core.getLoupePackageLatestVersionDate(f'@loupeteam/pkg{i:04d}') for i in range(4)]
+        assert all(error is None for error, _ in results)
+        assert registry.stats['rate_limited'] >= 1
+        assert registry.stats['ok'] == 4
+
+    def test_does_not_wait_out_long_rate_limits(self, registryEnv, monkeypatch):
+        registryEnv(packages=5, rateLimit=1, rateLimitWindow=3600)
+        monkeypatch.setattr(lpm_core.time, 'sleep', lambda seconds: pytest.fail('should not wait'))
+        assert lpm_core.getLoupePackageData('@loupeteam/pkg0000')[0] is None
+        error, _ = lpm_core.getLoupePackageData('@loupeteam/pkg0001')
+        assert error.startswith('Status code not OK. Code: 429')
+
+    def test_retries_injected_server_errors(self, registryEnv, monkeypatch):
+        registry = registryEnv(packages=300, errorRate=0.3, seed=1)
+        monkeypatch.setattr(lpm_core.time, 'sleep', lambda seconds: None)
+        error, packages = lpm_core.getLoupePackageListData()
+        assert error is None and len(packages) == 300
+        assert registry.stats['error'] >= 1
+
+    def test_requires_token_and_sends_rate_limit_headers(self, registryEnv):
+        registry = registryEnv(packages=1, rateLimit=10)
+        assert registry.handle('/orgs/loupeteam/packages', {})[0] == 401
+        status, headers, body = registry.handle('/orgs/loupeteam/packages', {'Authorization': 'Bearer x'})
+        assert status == 200 and len(body) == 1
+        assert headers['X-RateLimit-Remaining'] == '9'
+
+    def test_api_url_from_package_json(self, registryEnv, monkeypatch, tmp_path):
+        monkeypatch.delenv('LPM_GITHUB_API_URL', raising=False)
+        assert lpm_core.getGithubApiUrl() == 'https://api.github.com'
+        (tmp_path / 'package.json').write_text('{"lpmConfig": {"githubApiUrl": "http://127.0.0.1:9/"}}')
+        assert lpm_core.getGithubApiUrl() == 'http://127.0.0.1:9'
+
+    def test_package_json_cannot_send_the_token_elsewhere(self, registryEnv, monkeypatch, tmp_path):
+        monkeypatch.delenv('LPM_GITHUB_API_URL', raising=False)
+        (tmp_path / 'package.json').write_text('{"lpmConfig": {"githubApiUrl": "https://attacker.example"}}')
+        assert lpm_core.getGithubApiUrl() == 'https://api.github.com'
+        monkeypatch.setenv('LPM_GITHUB_API_URL', 'https://ghe.example/api/v3')
+        assert lpm_core.getGithubApiUrl() == 'https://ghe.example/api/v3'
@@ -0,0 +1,163 @@
+"""Performance regression gates for the LPM hot paths.
+
+Each test runs one hot path on a synthetic project from lpm_bench.py and
+compares it against test/perf_baseline.json. Operation counts (manifest reads
+and parses, .pkg and cpu.sw writes, child processes) must not grow at all:
+they are deterministic, so they catch regressions even on noisy CI runners.
+Wall time is only checked loosely, against a multiple of the baseline.
+
+Set LPM_PERF_UPDATE_BASELINE=1 to rewrite the baseline from the current run
+(on a reference machine, after an intentional change). LPM_PERF_TIME_FACTOR
+sets the allowed slowdown (default 4.0). Baseline times that are null, or
+that were recorded on another platform (e.g. a Linux baseline on a Windows CI
+runner), are not checked.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from unittest.mock import MagicMock
+
+import lpm_bench
+import pytest
+
+import lpm_core
+
+_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'perf_baseline.json')
+_UPDATE_BASELINE = os.environ.get('LPM_PERF_UPDATE_BASELINE') == '1'
+_TIME_FACTOR = float(os.environ.get('LPM_PERF_TIME_FACTOR', '4.0'))
+_SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+_LPM_SCRIPT = os.path.join(_SRC, 'LPM.py')
+
+# The "large" benchmark size: 200 libraries, 20 programs, 10 configurations.
+_SIZE = 'large'
+
+
+def _loadBaseline():
+    try:
+        with open(_BASELINE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+_baseline = _loadBaseline()
+
+
+@pytest.fixture(scope='module', autouse=True)
+def _saveBaseline():
+    yield
+    if _UPDATE_BASELINE:
+        with open(_BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(_baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+def _measure(function, runs=3):
+    """Run function `runs` times; return (median seconds, counters of the last run).
+
+    Each run starts with a cold manifest cache, like a fresh lpm process.
+    """
+    samples = []
+    for _ in range(runs):
+        lpm_core._manifestCache.clear()
+        lpm_core.startMetrics()
+        start = time.perf_counter()
+        try:
+            function()
+        finally:
+            samples.append(time.perf_counter() - start)
+            lpm_core.stopMetrics()
+    counters = {name: data['total'] for name, data in lpm_core.getMetricsSnapshot()['counters'].items()}
+    return statistics.median(samples), counters
+
+
+def _check(name, seconds, counters):
+    if _UPDATE_BASELINE:
+        _baseline[name] = {'seconds': round(seconds, 4), 'platform': sys.platform, 'counters': counters}
+        return
+    expected = _baseline.get(name)
+    if expected is None:
+        pytest.fail(f'No baseline for {name}. Run with LPM_PERF_UPDATE_BASELINE=1 to record one.')
+    for counter, limit in expected['counters'].items():
+        assert counters.get(counter, 0) <= limit, f'{name}: {counter} rose from {limit} to {counters.get(counter, 0)}'
+    unexpected = set(counters) - set(expected['counters'])
+    assert not unexpected, f'{name}: new operations {sorted(unexpected)}'
+    if expected.get('seconds') is not None and expected.get('platform') == sys.platform:
+        assert seconds <= expected['seconds'] * _TIME_FACTOR, (
+            f'{name}: {seconds:.3f}s vs baseline {expected["seconds"]:.3f}s (allowed factor {_TIME_FACTOR})'
+        )
+
+
+@pytest.fixture(scope='module')
+def project(tmp_path_factory):
+    libraries, programs, configs = lpm_bench.SIZES[_SIZE]
+    root = str(tmp_path_factory.mktemp('perf'))
+    topLevel = lpm_bench.generateProject(root, libraries, programs, configs)
+    return root, topLevel, [f'Config{k}' for k in range(configs)]
+
+
+@pytest.fixture
+def inProject(project, monkeypatch):
+    root, topLevel, configs = project
+    monkeypatch.chdir(root)
+    monkeypatch.delenv('LPM_STORE_DIR', raising=False)
+    return topLevel, configs
+
+
+@pytest.fixture
+def asTools(monkeypatch):
+    # Stand in for aspython, like the unit tests do, so these gates run everywhere. Only the
+    # operations LPM asks Automation Studio for are counted, not the work aspython does for them.
+    monkeypatch.setattr(lpm_core, 'ASTools', MagicMock())
+
+
+class TestPerformance:
+    def test_dependency_walk(self, inProject):
+        topLevel, _ = inProject
+        seconds, counters = _measure(lambda: lpm_core.getAllDependencies(topLevel))
+        assert len(lpm_core.getAllDependencies(topLevel)) == 220
+        _check('dependencyWalk', seconds, counters)
+
+    def test_sync_200_libraries(self, inProject, asTools):
+        topLevel, _ = inProject
+        packages = lpm_core.getAllDependencies(topLevel)
+        # The first sync populates Logical; measure the re-sync that every later install performs.
+        lpm_core.syncPackages(packages)
+        seconds, counters = _measure(lambda: lpm_core.syncPackages(packages))
+        _check('sync200', seconds, counters)
+
+    def test_deploy_10_configs(self, inProject, asTools):
+        topLevel, configs = inProject
+        packages = lpm_core.getAllDependencies(topLevel)
+        lpm_core.syncPackages(packages)
+        seconds, counters = _measure(lambda: [lpm_core.deployPackages(config, packages) for config in configs])
+        _check('deploy10', seconds, counters)
+
+    def test_cli_startup(self):
+        # Count the modules outside the standard library that `lpm --version` imports.
+        code = (
+            'import json, runpy, sys\n'
+            'before = set(sys.modules)\n'
+            f'sys.path.insert(0, {_SRC!r})\n'
+            f'sys.argv = [{_LPM_SCRIPT!r}, "--version"]\n'
+            'try:\n'
+            f'    runpy.run_path({_LPM_SCRIPT!r}, run_name="__main__")\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'new = set(sys.modules) - before\n'
+            'print(json.dumps(sorted(m for m in new if m.split(".")[0] not in sys.stdlib_module_names)))'
+        )
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        modules = json.loads(output.splitlines()[-1])
+        # Time LPM's own share of startup, on top of the bare interpreter.
+        samples = []
+        for args in [['-c', 'pass'], [_LPM_SCRIPT, '--version']] * 5:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], capture_output=True, check=True)
+            samples.append(time.perf_counter() - start)
+        overhead = statistics.median(samples[1::2]) - statistics.median(samples[0::2])
+        _check('cliStartup', max(overhead, 0.0), {'modules.imported': len(modules)})
@@ -0,0 +1,166 @@
+"""Tests for the resident LPM server (lpm_server.py).
+
+The server runs in a subprocess with a small stand-in command runner, so these
+tests exercise the socket protocol and stdio relaying without npm or GitHub.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+import lpm_server
+
+_SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+_SERVER_SCRIPT = textwrap.dedent(
+    """
+    import os, subprocess, sys, time
+    sys.path.insert(0, {src!r})
+    import lpm_server
+
+    def run(argv):
+        if argv[0] == 'echo':
+            print(' '.join(argv[1:]))
+        elif argv[0] == 'input':
+            print('got ' + input())
+        elif argv[0] == 'child':
+            subprocess.run([sys.executable, '-c', 'print("from child")'])
+        elif argv[0] == 'cwd':
+            print(os.getcwd())
+        elif argv[0] == 'env':
+            print(os.environ.get('LPM_TEST_VALUE'))
+        elif argv[0] == 'exit':
+            sys.exit(3)
+        elif argv[0] == 'raise':
+            raise RuntimeError('boom')
+        elif argv[0] == 'sleep':
+            time.sleep(float(argv[1]))
+            print('slept')
+
+    lpm_server.serve(run, {idleTimeout})
+    """
+)
+
+
+def _startServer(tmp_path, monkeypatch, idleTimeout=30):
+    monkeypatch.setenv('LPM_SERVER_STATE', str(tmp_path / 'server.json'))
+    script = _SERVER_SCRIPT.format(src=_SRC, idleTimeout=idleTimeout)
+    process = subprocess.Popen([sys.executable, '-c', script], env=dict(os.environ))
+    assert lpm_server.waitForServer() is not None
+    return process
+
+
+def _start(argv, cwd, env=None):
+    state = lpm_server.getServerState()
+    connection = lpm_server._connect(state, timeout=10)
+    channel = lpm_server._Channel(connection)
+    channel.send({'token': state['token'], 'argv': argv, 'cwd': str(cwd), 'env': env or dict(os.environ)})
+    return connection, channel
+
+
+def _run(argv, cwd, stdin=None, env=None):
+    """Minimal client mirroring bin/lpm.js. Returns (stdout, stderr, exitCode)."""
+    connection, channel = _start(argv, cwd, env)
+    with connection:
+        if stdin is not None:
+            channel.send({'stdin': stdin})
+        channel.send({'stdin': None})
+        out, err = '', ''
+        while True:
+            message = channel.receive()
+            if 'stdout' in message:
+                out += message['stdout']
+            if 'stderr' in message:
+                err += message['stderr']
+            if 'exit' in message:
+                return out, err, message['exit']
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    process = _startServer(tmp_path, monkeypatch)
+    yield process
+    lpm_server.requestServer('stop')
+    process.wait(timeout=10)
+
+
+class TestResidentServer:
+    def test_relays_output_and_exit_code(self, server, tmp_path):
+        assert _run(['echo', 'hello', 'world'], tmp_path) == ('hello world\n', '', 0)
+        assert _run(['exit'], tmp_path)[2] == 3
+
+    def test_runs_in_client_cwd_and_env(self, server, tmp_path):
+        assert _run(['cwd'], tmp_path)[0].strip() == os.path.realpath(tmp_path)
+        env = dict(os.environ, LPM_TEST_VALUE='from-client')
+        assert _run(['env'], tmp_path, env=env)[0].strip() == 'from-client'
+
+    def test_forwards_stdin(self, server, tmp_path):
+        assert _run(['input'], tmp_path, stdin='yes\n')[0] == 'got yes\n'
+
+    def test_relays_child_process_output(self, server, tmp_path):
+        assert _run(['child'], tmp_path)[0] == 'from child\n'
+
+    def test_unhandled_error_reports_traceback(self, server, tmp_path):
+        _, err, exitCode = _run(['raise'], tmp_path)
+        assert exitCode == 1
+        assert 'RuntimeError: boom' in err
+
+    def test_serves_many_commands_in_one_process(self, server, tmp_path):
+        for i in range(5):
+            assert _run(['echo', str(i)], tmp_path)[0] == f'{i}\n'
+        assert lpm_server.requestServer('ping')['pid'] == server.pid
+
+    def test_ctrl_c_interrupts_the_command(self, server, tmp_path):
+        connection, channel = _start(['sleep', '30'], tmp_path)
+        with connection:
+            time.sleep(0.5)
+            start = time.monotonic()
+            channel.send({'signal': 'SIGINT'})
+            message = channel.receive()
+        assert message == {'exit': 130}
+        assert time.monotonic() - start < 10
+        assert _run(['echo', 'still', 'serving'], tmp_path)[0] == 'still serving\n'
+
+    def test_disconnect_interrupts_the_command(self, server, tmp_path):
+        connection, channel = _start(['sleep', '30'], tmp_path)
+        time.sleep(0.5)
+        start = time.monotonic()
+        channel.close()
+        connection.close()
+        assert _run(['echo', 'next'], tmp_path)[0] == 'next\n'
+        assert time.monotonic() - start < 10
+
+    def test_rejects_wrong_token(self, server, tmp_path):
+        state = lpm_server.getServerState()
+        with lpm_server._connect(state) as connection:
+            channel = lpm_server._Channel(connection)
+            channel.send({'token': 'wrong', 'control': 'ping'})
+            assert channel.receive() is None
+
+    def test_idle_timeout_stops_server(self, tmp_path, monkeypatch):
+        process = _startServer(tmp_path, monkeypatch, idleTimeout=1)
+        process.wait(timeout=10)
+        time.sleep(0.1)
+        assert lpm_server.getServerState() is None
+        assert lpm_server.requestServer('ping') is None
+
+    def test_stale_state_file_means_no_server(self, tmp_path, monkeypatch):
+        statePath = tmp_path / 'server.json'
+        monkeypatch.setenv('LPM_SERVER_STATE', str(statePath))
+        statePath.write_text(json.dumps({'family': 'tcp', 'address': '127.0.0.1:1', 'token': 'x'}))
+        assert lpm_server.requestServer('ping') is None
+
+    @pytest.mark.skipif(sys.platform == 'win32', reason='uses XDG_CACHE_HOME')
+    def test_state_file_defaults_to_a_per_user_directory(self, tmp_path, monkeypatch):
+        monkeypatch.delenv('LPM_SERVER_STATE', raising=False)
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        statePath = lpm_server.getServerStatePath()
+        assert os.path.dirname(statePath) == str(tmp_path / 'lpm')
+        lpm_server._writeServerState({'token': 'x'})
+        assert lpm_server.getServerState() == {'token': 'x'}
+        assert not os.path.exists(os.path.join(os.path.dirname(lpm_server.__file__), '.lpm-server.json'))
@@ -0,0 +1,70 @@
+"""Startup-time benchmark for the LPM CLI.
+
+Cheap commands such as ``lpm --version`` must not pay for the full import
+graph. These tests run LPM.py in fresh interpreters, so they measure what a
+user actually waits for, and compare against a bare interpreter to factor out
+Python's own startup cost on the current machine.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+_LPM_SCRIPT = os.path.join(_SRC, 'LPM.py')
+
+# Modules that only specific subcommands need.
+_HEAVY_MODULES = ['aspython', 'requests', 'concurrent.futures', 'InquirerPy']
+
+# Time LPM may add on top of bare interpreter startup before printing the version.
+_STARTUP_BUDGET_MS = float(os.environ.get('LPM_STARTUP_BUDGET_MS', '100'))
+
+
+def _env():
+    env = dict(os.environ)
+    # Let the warm-up run write bytecode so we time imports rather than compilation.
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def _median_runtime(args, runs=7):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], capture_output=True, check=True, env=_env())
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+class TestStartup:
+    def test_heavy_modules_not_imported_at_load(self):
+        code = (
+            f'import json, sys; sys.path.insert(0, {_SRC!r}); import LPM; '
+            f'print(json.dumps([m for m in {_HEAVY_MODULES!r} if m in sys.modules]))'
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, env=_env())
+        assert json.loads(result.stdout) == []
+
+    def test_version_prints_without_heavy_imports(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', _LPM_SCRIPT, '--version'],
+            capture_output=True,
+            text=True,
+            env=_env(),
+        )
+        assert result.stdout.startswith('LPM: ')
+        imported = {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines()}
+        assert imported.isdisjoint(_HEAVY_MODULES)
+
+    def test_version_startup_under_budget(self):
+        # Warm up bytecode caches for both measurements.
+        subprocess.run([sys.executable, _LPM_SCRIPT, '--version'], capture_output=True, env=_env())
+        baseline = _median_runtime(['-c', 'pass'])
+        lpm = _median_runtime([_LPM_SCRIPT, '--version'])
+        overheadMs = (lpm - baseline) * 1000
+        assert overheadMs < _STARTUP_BUDGET_MS, (
+            f'LPM startup overhead: {overheadMs:.1f} ms (interpreter: {baseline * 1000:.1f} ms)'
+        )
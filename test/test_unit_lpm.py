@@ -6,6 +6,9 @@ does read `src/version.json` at module load time, but that's the only
 filesystem touch and it's incidental to the tests themselves.)
 """
 
+import json
+import threading
+
 import pytest
 
 import LPM
@@ -90,6 +93,25 @@ class TestHoistGlobalFlags:
         # If no positional ever appears, flags are returned unchanged.
         assert LPM._hoist_global_flags(['--silent']) == ['--silent']
 
+    def test_profile_after_subcommand(self):
+        assert LPM._hoist_global_flags(['install', 'pkg', '--profile']) == ['--profile', 'install', 'pkg']
+
+    def test_value_flag_moves_with_value(self):
+        result = LPM._hoist_global_flags(['sync', '--profile-trace', 'trace.json', '--dry-run'])
+        assert result == ['--profile-trace', 'trace.json', 'sync', '--dry-run']
+
+    def test_metrics_out_after_packages(self):
+        result = LPM._hoist_global_flags(['install', 'pkg', '--metrics-out', 'm.json'])
+        assert result == ['--metrics-out', 'm.json', 'install', 'pkg']
+
+    def test_value_flag_with_equals(self):
+        assert LPM._hoist_global_flags(['sync', '--profile-trace=t.json']) == ['--profile-trace=t.json', 'sync']
+
+    def test_value_flag_before_subcommand_keeps_value(self):
+        # The value must not be mistaken for the subcommand.
+        result = LPM._hoist_global_flags(['--profile-trace', 'trace.json', 'install', '-s'])
+        assert result == ['--profile-trace', 'trace.json', '-s', 'install']
+
 
 class TestIsKnownCommand:
     @pytest.fixture
@@ -98,7 +120,23 @@ class TestIsKnownCommand:
 
     @pytest.mark.parametrize(
         'cmd',
-        ['install', 'uninstall', 'login', 'logout', 'status', 'init', 'view', 'info', 'list'],
+        [
+            'install',
+            'uninstall',
+            'login',
+            'logout',
+            'status',
+            'init',
+            'view',
+            'info',
+            'list',
+            'sync',
+            'deploy',
+            'watch',
+            'why',
+            'update',
+            'batch',
+        ],
     )
     def test_known_subcommands(self, parser_and_sub, cmd):
         parser, sub = parser_and_sub
@@ -131,3 +169,150 @@ class TestIsKnownCommand:
     def test_empty_argv(self, parser_and_sub):
         parser, sub = parser_and_sub
         assert LPM._is_known_command(parser, sub, []) is False
+
+    def test_value_flag_value_is_not_the_command(self, parser_and_sub):
+        parser, sub = parser_and_sub
+        assert LPM._is_known_command(parser, sub, ['--profile-trace', 'install', 'ci']) is False
+
+
+class TestAuthGate:
+    @pytest.mark.parametrize('argv', [['update'], ['update', '--source']])
+    def test_update_requires_login(self, tmp_path, monkeypatch, capsys, argv):
+        # Both forms end up in npm, which needs the registry token.
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(LPM, 'isAuthenticated', lambda: False)
+        (tmp_path / 'package.json').write_text('{}')
+        ran = []
+        ns = LPM._build_parser('LPM')[0].parse_args(argv)
+        ns.func = ran.append
+        LPM._run_command(ns)
+        assert ran == []
+        assert 'No credentials found' in capsys.readouterr().out
+
+
+class TestDeploy:
+    def test_unknown_config_sets_the_exit_status(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(LPM, 'isAuthenticated', lambda: True)
+        (tmp_path / 'package.json').write_text('{}')
+        ns = LPM._build_parser('LPM')[0].parse_args(['deploy', '--config', 'Missing'])
+        assert LPM.cmd_deploy(ns) is False
+        with pytest.raises(SystemExit) as info:
+            LPM._run_command(ns)
+        assert info.value.code == 1
+        assert 'Unknown configuration(s): Missing' in capsys.readouterr().out
+
+
+class TestUpdate:
+    def test_failed_repo_sets_the_exit_status(self, tmp_path, monkeypatch, capsys):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(LPM, 'isAuthenticated', lambda: True)
+        (tmp_path / 'package.json').write_text('{}')
+        (tmp_path / 'TempObjects').mkdir()
+        (tmp_path / 'TempObjects' / 'sourceInfo.json').write_text(
+            json.dumps({'@loupeteam/alpha': {'repoPath': './TempObjects/Alpha', 'packageSourcePath': ''}})
+        )
+        result = {'repoPath': './TempObjects/Alpha', 'packages': ['@loupeteam/alpha'], 'seconds': 0.1}
+        result.update(before='a' * 40, after='a' * 40, changed=False, error='git fetch failed')
+        monkeypatch.setattr(LPM, 'updateSourceRepos', lambda refs, jobs: [result])
+        ns = LPM._build_parser('LPM')[0].parse_args(['update', '--source'])
+        with pytest.raises(SystemExit) as info:
+            LPM._run_command(ns)
+        assert info.value.code == 1
+        assert '1 repo(s): 0 updated, 0 up to date, 1 failed.' in capsys.readouterr().out
+
+
+class TestBatch:
+    def test_reads_commands(self, tmp_path):
+        path = tmp_path / 'setup.lpm'
+        path.write_text(
+            '# provisioning\n\nlpm init -s\ninstall a "b c"  # trailing comment\ntype C:\\Projects\\Line1\n'
+        )
+        assert LPM._read_batch(str(path)) == [
+            (3, ['init', '-s']),
+            (4, ['install', 'a', 'b c']),
+            (5, ['type', 'C:\\Projects\\Line1']),
+        ]
+
+    @pytest.fixture
+    def batch(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(LPM, 'isAuthenticated', lambda: True)
+        (tmp_path / 'package.json').write_text('{}')
+        ran = []
+
+        def write(lines):
+            (tmp_path / 'batch.lpm').write_text('\n'.join(lines))
+            return LPM._build_parser('LPM')[0].parse_args(['batch', 'batch.lpm'])
+
+        return write, ran
+
+    def test_read_only_commands_run_concurrently_in_order(self, batch, monkeypatch, capsys):
+        write, ran = batch
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fake_view(args):
+            # Both commands must be running at once to get past the barrier.
+            barrier.wait()
+            print('view of ' + args.packages[0])
+
+        monkeypatch.setattr(LPM, 'cmd_view', fake_view)
+        LPM.cmd_batch(write(['view first', 'view second']))
+        output = capsys.readouterr().out
+        assert output.index('view of first') < output.index('> lpm view second') < output.index('view of second')
+        assert 'All 2 batch commands completed' in output
+
+    def test_child_process_output_is_replayed_in_order(self, batch, monkeypatch, capsys):
+        write, ran = batch
+
+        def fake_view(args):
+            # Runs a real child process; its output is printed by lpm_core's reader threads.
+            name = args.packages[0]
+            delay = '0.5' if name == 'first' else '0'
+            LPM.execute([f'sleep {delay}; echo {name}-out'], False)
+
+        monkeypatch.setattr(LPM, 'cmd_view', fake_view)
+        LPM.cmd_batch(write(['view first', 'view second']))
+        output = capsys.readouterr().out
+        assert (
+            output.index('> lpm view first')
+            < output.index('first-out')
+            < output.index('> lpm view second')
+            < output.index('second-out')
+        )
+
+    def test_commands_using_shared_caches_run_in_order(self, batch, monkeypatch, capsys):
+        write, ran = batch
+        monkeypatch.setattr(LPM, 'cmd_type', lambda args: ran.append(threading.current_thread()))
+        LPM.cmd_batch(write(['type first', 'type second']))
+        assert ran == [threading.main_thread()] * 2
+
+    @pytest.mark.parametrize('flag', ['--silent', '--nocolor'])
+    def test_global_flags_belong_to_the_batch(self, batch, monkeypatch, capsys, flag):
+        write, ran = batch
+        with pytest.raises(SystemExit) as info:
+            LPM.cmd_batch(write([f'install a {flag}']))
+        assert info.value.code == 2
+        assert 'to `lpm batch` itself' in capsys.readouterr().out
+
+    def test_stops_at_first_failure(self, batch, monkeypatch, capsys):
+        write, ran = batch
+
+        def fake_sync(args):
+            ran.append('sync')
+            raise RuntimeError('sync broke')
+
+        monkeypatch.setattr(LPM, 'cmd_sync', fake_sync)
+        monkeypatch.setattr(LPM, 'cmd_deploy', lambda args: ran.append('deploy'))
+        with pytest.raises(SystemExit) as info:
+            LPM.cmd_batch(write(['sync', 'deploy']))
+        assert info.value.code == 1 and ran == ['sync']
+        assert '1 of 2 batch commands failed, 1 skipped' in capsys.readouterr().out
+
+    def test_invalid_line_fails_before_running(self, batch, monkeypatch, capsys):
+        write, ran = batch
+        monkeypatch.setattr(LPM, 'cmd_type', lambda args: ran.append('type'))
+        with pytest.raises(SystemExit) as info:
+            LPM.cmd_batch(write(['type a', 'deploy --bogus']))
+        assert info.value.code == 2 and ran == []
+        assert 'Line 2: invalid command' in capsys.readouterr().out